@@ -1,26 +1,51 @@
+import tempfile
 import time
 import numpy as np
+from vectank.store import TankStore
 from vectank.tank import VecTank
 
 def benchmark():
-    tank = VecTank("benchmark_tank")
-    num_vectors = 10000
-    dimension = 128
-    vectors = np.random.rand(num_vectors, dimension)
-    
-    start = time.time()
-    for vec in vectors:
-        tank.add_vector(vec)
-    elapsed = time.time() - start
-    print(f"Added {num_vectors} vectors in {elapsed:.4f} seconds")
-    
-    # ランダムなクエリに対する検索テスト
-    query = np.random.rand(dimension)
-    start = time.time()
-    results = tank.search(query)
-    elapsed_search = time.time() - start
-    print(f"Search completed in {elapsed_search:.6f} seconds")
-    print("Top matching vector indices:", results)
+    num_vectors = 20000
+    dimension = 1200
+    top_k = 100
+    store_name = "benchmark_comm"
+
+    # ベンチマーク用に TankStore を同一プロセス内で起動（永続化ファイルは一時ディレクトリへ）
+    store_dir = tempfile.mkdtemp()
+    store = TankStore(store_dir=store_dir, store_name=store_name)
+    try:
+        tank = VecTank.create_tank("benchmark_tank", dim=dimension, max_capacity=num_vectors,
+                                   store_name=store_name, single_meta_size=64)
+        # Generator API で float32 を直接生成（float64 の中間配列とキャストを省く）
+        rng = np.random.default_rng()
+        vectors = rng.random((num_vectors, dimension), dtype=np.float32)
+
+        # 1 件ずつ add_vector を呼ぶのではなく、add_vectors で一括登録する
+        # （メタデータは不要なため None を渡し、空の辞書を num_vectors 個生成しない）
+        start = time.time()
+        tank.add_vectors(vectors)
+        elapsed = time.time() - start
+        print(f"Added {num_vectors} vectors in {elapsed:.4f} seconds")
+
+        # ランダムなクエリに対する検索テスト
+        query = rng.random(dimension, dtype=np.float32)
+        start = time.time()
+        results = tank.search(query, top_k=top_k)
+        elapsed_search = time.time() - start
+        print(f"Search completed in {elapsed_search * 1000:.3f} ms")
+        print("Top matching vector keys:", [key for key, *_ in results[:10]])
+
+        # 複数クエリを 1 回の行列積でまとめて検索
+        num_queries = 32
+        queries = rng.random((num_queries, dimension), dtype=np.float32)
+        start = time.time()
+        tank.search_batch(queries, top_k=top_k)
+        elapsed_batch = time.time() - start
+        print(f"Batch search of {num_queries} queries completed in {elapsed_batch * 1000:.3f} ms "
+              f"({elapsed_batch * 1000 / num_queries:.3f} ms/query)")
+        tank.close()
+    finally:
+        store.stop_event_loop()
 
 if __name__ == '__main__':
-    benchmark()
\ No newline at end of file
+    benchmark()
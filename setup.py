@@ -14,6 +14,10 @@ setup(
     install_requires=[
         'numpy',
     ],
+    extras_require={
+        'simd': ['simsimd'],
+        'bf16': ['ml_dtypes'],
+    },
     entry_points={
         'console_scripts': [
             'vectank-run=vectank.server:main',
@@ -1,7 +1,5 @@
 # vectank/__init__.py
-from .core import VectorSimMethod, SIM_METHODS
-from .tank import VecTank
-from .store import TankStore
+import importlib
 
 __all__ = [
     "VectorSimMethod",
@@ -9,3 +7,30 @@ __all__ = [
     "VecTank",
     "TankStore",
 ]
+
+# 公開名 → 定義元モジュール。`import vectank` の時点では NumPy や共有メモリ関連のモジュールを読み込まず、
+# 初回アクセス時に import する（PEP 562）
+_LAZY_IMPORTS = {
+    "VectorSimMethod": ".core",
+    "SIM_METHODS": ".core",
+    "VecTank": ".tank",
+    "TankStore": ".store",
+}
+
+# `import vectank` のみで `vectank.core` のように参照されるサブモジュール（同じく初回アクセス時に import）
+_SUBMODULES = ("core", "tank", "store", "server", "rwlock")
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        # import_module がパッケージの属性としてサブモジュールを登録するため、キャッシュは不要
+        return importlib.import_module("." + name, __name__)
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # 2 回目以降は通常の属性として参照されるようにキャッシュ
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_SUBMODULES))
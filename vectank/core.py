@@ -7,7 +7,16 @@
   - calc_inner: 内積による類似度計算関数
   - calc_cosine: コサイン類似度計算関数
   - calc_euclidean: ユークリッド距離に基づく類似度（距離が小さいほど類似度が高い）計算関数
+  - quantize_int8: int8 スカラー量子化（各ベクトルごとのスケール付き）
+  - row_norms: 各行の L2 ノルムを一時配列を作らずに計算
+  - select_top_k: スコア上位 k 件のインデックスを部分選択で取得
   - SIM_METHODS: 文字列キーと関数を紐付けた辞書
+  - 各計算関数は、クエリとして複数ベクトル (形状：(q, dim)) を渡すと、全クエリのスコアを
+    1 回の行列積（GEMM）でまとめて計算し、形状 (q, n) の配列を返します。
+  - SimSIMD（pip install VecTank[simd]）がインストールされている場合、内積・コサイン類似度・ユークリッド距離は
+    SimSIMD の SIMD カーネル（AVX2/AVX-512/NEON）で計算し、未インストール時は NumPy で計算します。
+  - float16 / bfloat16 で格納したベクトルは、SimSIMD の f16 / bf16 カーネルでクエリも同じ型に変換して計算します。
+    bfloat16 の型は ml_dtypes（pip install VecTank[bf16]）が提供します。
      
 【使用例】
   下記サンプルコードでは、複数のベクトルとクエリベクトルを用いて、各種計算関数がどのように動作するかを確認できます。
@@ -16,6 +25,18 @@
 import numpy as np
 from enum import Enum
 
+try:
+    # SimSIMD は任意依存（extras: simd）
+    import simsimd
+except ImportError:
+    simsimd = None
+
+try:
+    # ml_dtypes は任意依存（extras: bf16）。import 時に NumPy へ "bfloat16" 型が登録される
+    import ml_dtypes
+except ImportError:
+    ml_dtypes = None
+
 # ======================================================================
 # Enum 定義：VectorSimMethod
 # ======================================================================
@@ -27,61 +48,283 @@ class VectorSimMethod(Enum):
     # ユークリッド距離を用いた計算（距離が小さいほど類似度が高いと解釈するため、負の値を返す）
     EUCLIDEAN = "euclidean"
 
+# bfloat16 の NumPy dtype（ml_dtypes 未インストール時は None）
+BFLOAT16 = np.dtype(ml_dtypes.bfloat16) if ml_dtypes is not None else None
+# 16bit 浮動小数点の格納型（検索時はクエリもこの型に変換して計算）
+_HALF_DTYPES = (np.dtype("float16"),) + ((BFLOAT16,) if BFLOAT16 is not None else ())
+# SimSIMD に渡すことのできる要素型
+_SIMSIMD_DTYPES = (np.dtype("float32"), np.dtype("int8")) + _HALF_DTYPES
+# NumPy で 16bit / int8 の行列を float32 に変換しながら内積を計算する際の、1 ブロックあたりの変換後のバイト数
+_UPCAST_BLOCK_BYTES = 1 << 20
+
+# ======================================================================
+# _simsimd_scores: SimSIMD による一括計算
+# ======================================================================
+def _simsimd_scores(vectors: np.ndarray, query: np.ndarray, metric: str):
+    """
+    SimSIMD の cdist でクエリと全ベクトルとの値を一括計算します。
+    SimSIMD が利用できない、または型が揃った C 連続配列（float32 / float16 / bfloat16 / int8）でない場合は None を返します。
+    
+    引数:
+      vectors (np.ndarray): 複数のベクトルを含む配列 (形状：(n, dim))
+      query (np.ndarray): クエリベクトル (形状：(dim,) または (q, dim))
+      metric (str): SimSIMD のメトリクス名（"dot"・"cosine"・"sqeuclidean"）
+    
+    戻り値:
+      計算結果を格納した配列 (形状：(n,) または (q, n))、または None
+    """
+    if simsimd is None or len(vectors) == 0:
+        return None
+    if vectors.dtype != query.dtype or vectors.dtype not in _SIMSIMD_DTYPES:
+        return None
+    if not vectors.flags.c_contiguous or not query.flags.c_contiguous:
+        return None
+    queries = np.atleast_2d(query)
+    if BFLOAT16 is not None and vectors.dtype == BFLOAT16:
+        # ml_dtypes の配列はバッファプロトコルに対応しないため、同じビット列の uint16 として渡す
+        scores = np.asarray(simsimd.cdist(queries.view(np.uint16), vectors.view(np.uint16), metric=metric, dtype="bf16"))
+    else:
+        scores = np.asarray(simsimd.cdist(queries, vectors, metric=metric))
+    return scores[0] if query.ndim == 1 else scores
+
+# ======================================================================
+# quantize_int8: int8 スカラー量子化
+# ======================================================================
+def quantize_int8(vectors: np.ndarray):
+    """
+    ベクトル（または複数ベクトルの各行）を int8 にスカラー量子化します。
+    各ベクトルの最大絶対値が 127 となるようにスケールを決め、「値 ≒ 量子化値 × スケール」で復元できるようにします。
+    
+    引数:
+      vectors (np.ndarray): 量子化するベクトル (形状：(dim,) または (n, dim))
+    
+    戻り値:
+      (int8 に量子化した配列, 各ベクトルのスケールを格納した float32 配列)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=-1) / 127.0
+    # ゼロベクトルはスケール 1 として扱い、ゼロ除算を避ける
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    quantized = np.clip(np.rint(vectors / scales[..., np.newaxis]), -127, 127).astype(np.int8)
+    return quantized, scales
+
+# ======================================================================
+# row_norms: 各行の L2 ノルム
+# ======================================================================
+def row_norms(vectors: np.ndarray) -> np.ndarray:
+    """
+    各行の L2 ノルムを計算します。
+    np.linalg.norm(axis=1) と異なり、要素の二乗を格納する (n, dim) の一時配列を作らず、
+    einsum で二乗和を行ごとに 1 パスで集計します（16bit / int8 の行は float32、float64 / int64 の行は float64 で累積）。
+    
+    引数:
+      vectors (np.ndarray): 複数のベクトルを含む配列 (形状：(n, dim))
+    
+    戻り値:
+      各行の L2 ノルムを格納した配列 (形状：(n,))
+    """
+    squared = np.einsum("ij,ij->i", vectors, vectors, dtype=np.result_type(vectors.dtype, np.float32))
+    return np.sqrt(squared, out=squared)
+
+def _query_norm(query: np.ndarray):
+    """
+    クエリの L2 ノルムを、スコア配列 (n,) / (q, n) にそのままブロードキャストできる形で返します。
+    1 クエリの場合は np.linalg.norm の引数検査・型ディスパッチを避け、np.vdot と sqrt 1 回で計算します。
+    """
+    if query.ndim == 1:
+        return np.sqrt(np.vdot(query, query))
+    return row_norms(query)[:, np.newaxis]
+
+# ======================================================================
+# _blocked_dot: 行ブロックごとの内積
+# ======================================================================
+def _blocked_dot(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    vectors とクエリの内積を計算します。float32 以外（16bit / int8）で格納された vectors は、
+    np.dot に直接渡すと行列全体の float32 コピーが作られるため、キャッシュに収まる行ブロックごとに
+    float32 へ変換しながら計算します。
+    """
+    if vectors.dtype == np.float32:
+        return np.dot(query, vectors.T)
+    n = vectors.shape[0]
+    block_rows = max(1, _UPCAST_BLOCK_BYTES // (vectors.shape[1] * 4))
+    scores = np.empty(query.shape[:-1] + (n,), dtype=np.float32)
+    for start in range(0, n, block_rows):
+        block = vectors[start:start + block_rows].astype(np.float32)
+        scores[..., start:start + block.shape[0]] = np.dot(query, block.T)
+    return scores
+
+# ======================================================================
+# _dot: 内積の共通計算
+# ======================================================================
+def _dot(vectors: np.ndarray, query: np.ndarray, scales: np.ndarray = None) -> np.ndarray:
+    """
+    各ベクトルとクエリの内積を計算します（クエリが (q, dim) の場合は 1 回の行列積で (q, n) を返します）。
+    scales が与えられた場合は vectors を int8 量子化済みとみなし、各行のスケールを掛けて元の値での内積に戻します。
+    """
+    if vectors.dtype in _HALF_DTYPES:
+        # 16bit 格納時はクエリも同じ型に変換し、SimSIMD の f16 / bf16 カーネルで計算
+        scores = _simsimd_scores(vectors, query.astype(vectors.dtype), "dot")
+        return scores if scores is not None else _blocked_dot(vectors, query)
+    if scales is None:
+        # float32 の複数クエリはペア単位の SimSIMD より BLAS の GEMM の方が行列を再利用できるため速い
+        scores = _simsimd_scores(vectors, query, "dot") if query.ndim == 1 else None
+        return scores if scores is not None else np.dot(query, vectors.T)
+    scores = None
+    if simsimd is not None:
+        # クエリも int8 に量子化し、int8 同士の内積（SimSIMD の i8 カーネル）で計算
+        query_q, query_scale = quantize_int8(query)
+        scores = _simsimd_scores(vectors, query_q, "dot")
+        if scores is not None:
+            scores *= query_scale[..., np.newaxis] if query.ndim == 2 else query_scale
+    if scores is None:
+        scores = _blocked_dot(vectors, query)
+    # 一時配列を作らないよう、スコア配列上でスケールを掛ける
+    scores *= scales
+    return scores
+
 # ======================================================================
 # calc_inner: 内積による計算関数
 # ======================================================================
-def calc_inner(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+def calc_inner(vectors: np.ndarray, query: np.ndarray, norms: np.ndarray = None,
+               scales: np.ndarray = None) -> np.ndarray:
     """
     内積を利用して、ベクトル集合と1つのクエリベクトル間の類似度スコアを計算します。
     
     引数:
       vectors (np.ndarray): 複数のベクトルを含む配列 (形状：(n, dim))
-      query (np.ndarray): 比較対象のクエリベクトル (形状：(dim,))
+      query (np.ndarray): 比較対象のクエリベクトル (形状：(dim,) または (q, dim))
+      norms (np.ndarray): 各ベクトルの L2 ノルム（内積では未使用。呼び出し形式を揃えるための引数）
+      scales (np.ndarray): vectors が int8 量子化済みの場合の各行のスケール (形状：(n,))
     
     戻り値:
-      各ベクトルとクエリの内積を格納した配列 (形状：(n,))
+      各ベクトルとクエリの内積を格納した配列 (形状：(n,) または (q, n))
     """
-    return np.dot(vectors, query)
+    return _dot(vectors, query, scales)
 
 # ======================================================================
 # calc_cosine: コサイン類似度計算関数
 # ======================================================================
-def calc_cosine(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+def calc_cosine(vectors: np.ndarray, query: np.ndarray, norms: np.ndarray = None,
+                scales: np.ndarray = None) -> np.ndarray:
     """
     コサイン類似度を計算します。
     コサイン類似度は、2つのベクトルの方向性の類似度を示し、1に近いほど類似していることを意味します。
+    各ベクトルの L2 ノルム（norms）が与えられた場合は、行列への走査を内積 1 回のみで済ませます。
     
     引数:
       vectors (np.ndarray): 複数のベクトルが格納された配列 (形状：(n, dim))
-      query (np.ndarray): クエリベクトル (形状：(dim,))
+      query (np.ndarray): クエリベクトル (形状：(dim,) または (q, dim))
+      norms (np.ndarray): 事前計算済みの各ベクトルの L2 ノルム (形状：(n,))、省略時は都度計算
+      scales (np.ndarray): vectors が int8 量子化済みの場合の各行のスケール (形状：(n,))
     
     戻り値:
-      各ベクトルとクエリのコサイン類似度スコアを格納した配列 (形状：(n,))
+      各ベクトルとクエリのコサイン類似度スコアを格納した配列 (形状：(n,) または (q, n))
     """
-    # 各ベクトルの L2 ノルム（各行ごと）を計算
-    norm_vectors = np.linalg.norm(vectors, axis=1)
+    if norms is not None:
+        # ノルムはキャッシュ済みのため、内積 1 回とクエリのノルムのみ計算
+        # 分母・スコアともに同じ配列上で演算し、(n,) の一時配列を最小限に抑える
+        denominator = norms * _query_norm(query)
+        denominator += 1e-8
+        scores = _dot(vectors, query, scales)
+        scores /= denominator
+        return scores
+    if scales is not None:
+        # 量子化済みのベクトルを元の値に復元
+        vectors = vectors * scales[:, np.newaxis]
+    # SimSIMD はコサイン距離（1 - 類似度）を返すため類似度に変換
+    distances = _simsimd_scores(vectors, query, "cosine")
+    if distances is not None:
+        return 1.0 - distances
+    # 各ベクトルの L2 ノルム（各行ごと）を、行列への内積と同様に 1 パスで計算
+    norm_vectors = row_norms(vectors)
     # クエリの L2 ノルムを計算
-    norm_query = np.linalg.norm(query)
+    norm_query = _query_norm(query)
     # 内積をそれぞれのノルムの積で割ってコサイン類似度を算出
     # ゼロ除算対策として微小な定数 1e-8 を加算
-    return np.dot(vectors, query) / (norm_vectors * norm_query + 1e-8)
+    return np.dot(query, vectors.T) / (norm_vectors * norm_query + 1e-8)
+
+# ======================================================================
+# _euclidean_distances: 行ブロックごとのユークリッド距離
+# ======================================================================
+def _euclidean_distances(vectors: np.ndarray, query: np.ndarray, scales: np.ndarray = None) -> np.ndarray:
+    """
+    各ベクトルと 1 つのクエリ (形状：(dim,)) とのユークリッド距離を計算します。
+    差分配列を行列全体 (n, dim) ではなくキャッシュに収まる行ブロック単位で作り、
+    同じブロック上で復元（int8 の場合）・差分・二乗和の集計を行います。
+    """
+    n = vectors.shape[0]
+    block_rows = max(1, _UPCAST_BLOCK_BYTES // (vectors.shape[1] * 4))
+    distances = np.empty(n, dtype=np.float32)
+    for start in range(0, n, block_rows):
+        block = vectors[start:start + block_rows].astype(np.float32)
+        if scales is not None:
+            # 量子化済みのベクトルを元の値に復元
+            block *= scales[start:start + block_rows, np.newaxis]
+        block -= query
+        distances[start:start + block.shape[0]] = np.einsum("ij,ij->i", block, block)
+    return np.sqrt(distances, out=distances)
 
 # ======================================================================
 # calc_euclidean: ユークリッド距離に基づく類似度計算関数
 # ======================================================================
-def calc_euclidean(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+def calc_euclidean(vectors: np.ndarray, query: np.ndarray, norms: np.ndarray = None,
+                   scales: np.ndarray = None) -> np.ndarray:
     """
     ユークリッド距離を計算し、その負の値を類似度スコアとして返します。
     距離が小さいほど(負の値が大きいほど)類似度が高いと解釈します。
     
     引数:
       vectors (np.ndarray): 複数のベクトルを含む配列 (形状：(n, dim))
-      query (np.ndarray): クエリベクトル (形状：(dim,))
+      query (np.ndarray): クエリベクトル (形状：(dim,) または (q, dim))
+      norms (np.ndarray): 各ベクトルの L2 ノルム（未使用）。VecTank は SIM_METHODS のどの関数も
+                          norms・scales を指定して同じ形式で呼び出すため、calc_inner と同様に引数としては受け付ける
+      scales (np.ndarray): vectors が int8 量子化済みの場合の各行のスケール (形状：(n,))
+    
+    戻り値:
+      各ベクトルとクエリとのユークリッド距離の負の値を格納した配列 (形状：(n,) または (q, n))
+    """
+    # ||a||² + ||q||² - 2 a·q の展開（キャッシュ済みのノルムを使う形）は、原点から離れたデータで桁落ちして
+    # 順位が崩れるため使わず、差分から直接計算する
+    if scales is None:
+        # SimSIMD の sqeuclidean は差分の二乗和を直接計算するため、展開式のような桁落ちがない
+        squared = _simsimd_scores(vectors, query.astype(vectors.dtype) if vectors.dtype in _HALF_DTYPES else query,
+                                  "sqeuclidean")
+        if squared is not None:
+            return -np.sqrt(squared)
+    if query.ndim == 2:
+        # 差分配列が (q, n, dim) とならないよう、クエリごとに計算
+        return np.stack([-_euclidean_distances(vectors, q, scales) for q in query])
+    return -_euclidean_distances(vectors, query, scales)
+
+# ======================================================================
+# select_top_k: 上位 k 件の選択
+# ======================================================================
+def select_top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    スコアの大きい順に上位 top_k 件のインデックスを返します。
+    全件ソート（O(n log n)）ではなく np.argpartition による部分選択（O(n)）で top_k 番目のスコアを求め、
+    それ以上のスコアを持つ候補のみをソートします。
+    同じスコアの行はインデックスの昇順（キーの昇順）に並び、top_k 件目の境界で同点の行がある場合も
+    インデックスの小さい行を優先します。
+    
+    引数:
+      scores (np.ndarray): 類似度スコアの配列 (形状：(n,))
+      top_k (int): 取得件数
     
     戻り値:
-      各ベクトルとクエリとのユークリッド距離の負の値を格納した配列 (形状：(n,))
+      スコアの降順に並んだインデックスの配列 (形状：(min(top_k, n),))
     """
-    return -np.linalg.norm(vectors - query, axis=1)
+    n = scores.shape[0]
+    if top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if top_k >= n:
+        return np.argsort(-scores, kind="stable")
+    # argpartition は境界で同点の行を任意に選ぶため、top_k 番目のスコア以上の行をすべて候補とする
+    threshold = scores[np.argpartition(scores, n - top_k)[n - top_k]]
+    candidates = np.flatnonzero(scores >= threshold)
+    # 候補はインデックスの昇順のため、安定ソートで同点の行の順序を保つ
+    return candidates[np.argsort(-scores[candidates], kind="stable")[:top_k]]
 
 # ======================================================================
 # SIM_METHODS 辞書: 類似度計算方式のマッピング
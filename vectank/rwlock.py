@@ -0,0 +1,60 @@
+"""
+【概要】
+  本ファイルは、読み取り操作（検索・取得・フィルタ）同士の並行実行を許し、
+  書き込み操作（追加・更新・削除・クリア）のみを排他とするリーダー・ライターロック RWLock を定義しています。
+
+【注意点】
+  - multiprocessing の Condition / RawValue で実装しているため、従来の multiprocessing.Lock と同じ範囲
+    （同一プロセス内のスレッド、および fork により生成されたプロセス間）で共有されます。
+  - 書き込み待ちがある間は新たな読み取りを受け付けない（writer 優先）ため、書き込みが飢餓状態になりません。
+  - 再入（読み取り中に同じスレッドから書き込みロックを取得する等）には対応していません。
+"""
+
+import multiprocessing
+from contextlib import contextmanager
+
+class RWLock:
+    def __init__(self):
+        # 状態の参照・更新はすべて Condition 配下で行う
+        self._cond = multiprocessing.Condition(multiprocessing.Lock())
+        # 読み取り中の数
+        self._readers = multiprocessing.RawValue("i", 0)
+        # 書き込み中かどうか（0 / 1）
+        self._writing = multiprocessing.RawValue("i", 0)
+        # 書き込み待ちの数
+        self._waiting_writers = multiprocessing.RawValue("i", 0)
+
+    @contextmanager
+    def read_lock(self):
+        """
+        読み取りロックを取得します。他の読み取りとは並行して実行されます。
+        """
+        with self._cond:
+            while self._writing.value or self._waiting_writers.value:
+                self._cond.wait()
+            self._readers.value += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers.value -= 1
+                if self._readers.value == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        """
+        書き込みロックを取得します。他の読み取り・書き込みとは排他となります。
+        """
+        with self._cond:
+            self._waiting_writers.value += 1
+            while self._writing.value or self._readers.value:
+                self._cond.wait()
+            self._waiting_writers.value -= 1
+            self._writing.value = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing.value = 0
+                self._cond.notify_all()
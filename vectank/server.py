@@ -15,7 +15,6 @@ import argparse
 import os
 import time
 import logging
-from vectank.store import TankStore  # TankStore は永続化ファイルから VecTank を管理するクラス
 
 def main():
     # ログの初期設定（INFO レベル、時刻・レベル情報付き）
@@ -41,8 +40,22 @@ def main():
         default="tankstore_comm",
         help="通信用共有メモリの名前 (デフォルト: tankstore_comm)"
     )
+    parser.add_argument(
+        "--load_concurrency",
+        type=int,
+        default=None,
+        help="起動時にタンクを並行して復元するスレッド数 (デフォルト: min(32, CPU 数 × 2))"
+    )
+    parser.add_argument(
+        "--checkpoint_interval",
+        type=float,
+        default=None,
+        help="変更のあった永続化タンクをバックグラウンドで保存する間隔（秒）(デフォルト: 自動保存しない)"
+    )
     
     args = parser.parse_args()
+    # TankStore（NumPy・共有メモリ関連を含む）は引数の解析後に読み込み、--help や引数エラー時の起動を軽くする
+    from vectank.store import TankStore  # TankStore は永続化ファイルから VecTank を管理するクラス
     store_dir = args.store_dir
     store_name = args.store_name
 
@@ -53,7 +66,8 @@ def main():
     
     # TankStore の初期化: store_dir 内の既存タンク（永続化ファイル）を自動復元
     logging.info("共有メモリストアを初期化中 (store_dir=%s, store_name=%s)...", store_dir, store_name)
-    store = TankStore(store_dir=store_dir, store_name=store_name)
+    store = TankStore(store_dir=store_dir, store_name=store_name, load_concurrency=args.load_concurrency,
+                      checkpoint_interval=args.checkpoint_interval)
     logging.info("TankStore が初期化されました。登録タンク数: %d", len(store.tanks))
     
     # サーバプロセスの待機ループ
@@ -63,11 +77,9 @@ def main():
             time.sleep(1)
     except KeyboardInterrupt:
         logging.info("サーバプロセス停止中... 各タンクの状態を永続化し、イベントループを停止します。")
-        # 各タンクの永続化処理（TankStore 側で管理）を実施する場合は、
-        # ここで必要に応じた処理（例：tank.save()）を呼び出してください。
-        for tank in store.tanks.values():
-            # tank.save() は空実装のため、実際の保存処理が必要ならここに追加
-            logging.info("Tank '%s' の永続化処理を実施。", tank.tank_name)
+        # 永続化モードのタンクのうち、前回の保存以降に変更のあったものだけを保存
+        for tank_name in store.save_dirty_tanks():
+            logging.info("Tank '%s' の永続化処理を実施。", tank_name)
         # TankStore のイベントループの停止と共有メモリの後片付け
         store.stop_event_loop()
         logging.info("TankStore のイベントループを停止しました。")
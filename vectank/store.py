@@ -3,24 +3,29 @@
   本ファイルは、複数のタンク（VecTank インスタンス）を一元管理する TankStore クラスを定義しています。
   
   TankStore の主な役割：
-    - 指定ディレクトリ(store_dir)内の永続化ファイル（.npz）をスキャンし、タンクを自動復元する。
+    - 指定ディレクトリ(store_dir)内の永続化ファイル（.pkl / .npy）をスキャンし、タンクを自動復元する。
     - 新規タンク作成(create_tank)や、既存タンクの取得(get_tank)のインターフェースを提供する。
     - 通信用共有メモリを用いた VecTank 側からのコマンド受付と、
       イベントループでのコマンド処理を行う。
   
 【注意点】
-  - 永続化ファイルは、タンク名に基づいて "{tank_name}.npz"（および対応する .pkl）として保存されます。
-  - 自動復元時は、仮に次元128、最大容量10000として復元を試みますが、
-    実際はメタデータから取得する等の改良が必要です。
+  - 永続化ファイルは、タンク名に基づいて "{tank_name}.npy"（ベクトル）、"{tank_name}.pkl"（メタデータ）、
+    int8 量子化タンクの場合は "{tank_name}.scales.npy"（各行のスケール）として保存されます。
+  - 自動復元時は、メタデータ内のパラメータ（次元数、最大容量など）に従ってタンクを生成します。
+    旧形式の "{tank_name}.npz" も読み込み可能です。
 """
 
+import itertools
 import os
 import pickle
+import select
+import stat
 import time
 import numpy as np
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import shared_memory, Lock, resource_tracker
-from vectank.tank import VecTank
+from vectank.tank import VecTank, wakeup_path
 import traceback
 
 class TankStore:
@@ -31,14 +36,24 @@ class TankStore:
     """
     _lock = Lock()  # スレッドセーフな操作を保証するためのロック
     
-    def __init__(self, store_dir: str = None, store_name: str = "tankstore_comm"):
+    def __init__(self, store_dir: str = None, store_name: str = "tankstore_comm", load_concurrency: int = None,
+                 checkpoint_interval: float = None):
         """
         コンストラクタ
           store_dir: 永続化ファイルの格納ディレクトリ。指定がなければカレントディレクトリを利用。
           store_name: 通信用共有メモリの名前。デフォルトは "tankstore_comm"。
+          load_concurrency: 起動時にタンクを並行して復元するスレッド数。指定がなければ min(32, CPU 数 × 2)。
+          checkpoint_interval: 変更のあった永続化モードのタンクをバックグラウンドで保存する間隔（秒）。
+                               指定がなければ自動保存は行わない。
         """
         self.store_dir = store_dir if store_dir is not None else os.getcwd()
+        self.load_concurrency = load_concurrency if load_concurrency else min(32, (os.cpu_count() or 1) * 2)
+        self.checkpoint_interval = checkpoint_interval
         self.tanks = {}  # タンク名をキーとした VecTank インスタンスの辞書
+        # タンク名 → 最後に保存（または復元）した時点のメタデータの世代番号
+        self._saved_generations = {}
+        # 保存コマンドと自動保存が同じファイルへ同時に書き込まないよう直列化するロック
+        self._save_lock = threading.Lock()
         self._load_all_tanks()
 
         # 通信用共有メモリの生成
@@ -56,25 +71,42 @@ class TankStore:
         # 初期化：全バイトを 0 にセット
         self._comm_buffer.fill(0)
 
+        # コマンド到着の通知用 FIFO を生成（mkfifo 非対応の環境や生成できない場合は None のまま、一定間隔の確認で代替）
+        self._wakeup_path = wakeup_path(store_name)
+        self._wakeup_fd = None
+        if hasattr(os, "mkfifo"):
+            self._wakeup_fd = self._open_wakeup_fifo()
+        # 通知がない場合にバッファを確認する間隔（秒）。通知を送らないクライアントを検出したら短くする
+        self._poll_interval = 0.05
+        # 通知なしで届いたコマンドの連続数（通知付きのコマンドが届くと 0 に戻る）
+        self._unnotified_commands = 0
+
         # イベントループの停止用フラグ
         self._stop_event = threading.Event()
         # イベントループスレッドの生成
         self._event_thread = threading.Thread(target=self.event_loop, daemon=True)
         self._event_thread.start()
+        # 自動保存スレッドの生成（checkpoint_interval 指定時のみ）
+        self._checkpoint_thread = None
+        if self.checkpoint_interval:
+            self._checkpoint_thread = threading.Thread(target=self._checkpoint_loop, daemon=True)
+            self._checkpoint_thread.start()
 
-    def create_tank(self, tank_name: str, dim: int, persist: bool = False, max_capacity: int = 10000, single_meta_size: int = 4096, sim_method: str = "COSINE"):
+    def create_tank(self, tank_name: str, dim: int, persist: bool = False, max_capacity: int = 10000, single_meta_size: int = 4096, sim_method: str = "COSINE",
+                    dtype: str = "float32"):
         """
         新規タンクを作成し管理辞書に登録する
           tank_name: タンク名（重複は不可）
           dim: タンク内の各ベクトルの次元数
           persist: 永続化モードを有効にする場合 True
           max_capacity: タンクが保持可能な最大ベクトル数
+          dtype: ベクトルの格納型（"float32"、"float16"、"bfloat16" または "int8"）
         戻り値:
           作成された VecTank インスタンス
         """
         if tank_name in self.tanks:
             raise ValueError(f"Tank '{tank_name}' already exists.")
-        tank = VecTank(tank_name, dim, max_capacity, single_meta_size, persist, sim_method)
+        tank = VecTank(tank_name, dim, max_capacity, single_meta_size, persist, sim_method, dtype)
         print(f"[DEBUG] create tank: {tank.tank_name}")
         tank.create_shared_memory()
         print(f"[DEBUG] create shared memory: {tank.tank_name}")
@@ -91,137 +123,441 @@ class TankStore:
 
     def _load_all_tanks(self):
         """
-        指定した store_dir 内の永続化ファイル（拡張子 .npz）を検出し、
+        指定した store_dir 内のメタデータファイル（拡張子 .pkl）を検出し、
         それらに対応するタンクを自動復元する。
-        ここでは、ファイル名からタンク名を推定し、仮に次元を 128、最大容量を 10000 として
-        VecTank インスタンスを生成します。さらに、対応する拡張子 .pkl のメタデータファイルがあれば読み込み、
-        その内容を共有メモリに同期します。
+        ファイル名からタンク名を推定し、メタデータ内のパラメータ（次元数、最大容量など）で
+        VecTank インスタンスと共有メモリを生成した上で、メタデータとベクトルデータを共有メモリに同期します。
+        ベクトルデータ（.npy）はメモリマップで開き、ファイル全体をメモリに読み込まずに共有メモリへコピーします。
+        各タンクは独立したファイル・共有メモリを扱うため、最大 load_concurrency 個のスレッドで並行して復元します
+        （ファイル I/O と NumPy のコピーは GIL を解放するため、タンク数が多い場合の起動時間を短縮できます）。
         """
-        import pickle  # _load_all_tanks 内で利用するためインポート
         with self.__class__._lock:
-            for file in os.listdir(self.store_dir):
-                if file.endswith(".npz"):
-                    # ファイル名から拡張子を除いた部分をタンク名とする
-                    tank_name = file[:-4]
-                    if tank_name not in self.tanks:
-                        try:
-                            # タンクの復元処理
-                            tank = VecTank(tank_name)
-                            # pklファイルが存在する場合はメタデータを読み込む
-                            meta_path = os.path.join(self.store_dir, f"{tank_name}.pkl")
-                            if os.path.exists(meta_path):
-                                with open(meta_path, "rb") as f:
-                                    metadata = pickle.load(f)
-                                print(f"[DEBUG] Loaded metadata for tank: {tank_name}")
-                                # tank._read_shared_metadata()
-                                tank._parse_params(metadata.get("params", {}))
-                                tank.create_shared_memory()
-                                meta_bytes = pickle.dumps(metadata)
-                                if len(meta_bytes) > tank._meta_shm_size:
-                                    raise MemoryError("Serialized metadata exceeds shared memory size.")
-                                # 共有メモリバッファをクリアし、シリアライズしたデータを書き込み
-                                tank.meta_shm.buf[:tank._meta_shm_size] = b'\x00' * tank._meta_shm_size
-                                tank.meta_shm.buf[:len(meta_bytes)] = meta_bytes
-                                tank._read_shared_metadata()
-
-                            # ベクトルデータの読み込み
-                            vector_path = os.path.join(self.store_dir, f"{tank_name}.npz")
-                            if os.path.exists(vector_path):
-                                # ベクトルデータを読み込み
-                                with np.load(vector_path) as data:
-                                    loaded_vectors = data["vectors"]
-                                    tank.vectors[:loaded_vectors.shape[0]] = loaded_vectors
-                                 
-                            print(f"[DEBUG] Restored metadata for tank: {str(tank)}")
-                            
-                            self.tanks[tank_name] = tank
-                            print(f"[DEBUG] Restored tank: {tank_name}")
-                        except Exception as e:
-                            print(f"[ERROR] Failed to restore tank '{tank_name}': {e}")
-                            traceback.print_exc()
+            self._recover_interrupted_saves()
+            # os.scandir はディレクトリ読み出し時に得た種別情報を保持するため、ファイル判定に stat を発行しない
+            with os.scandir(self.store_dir) as entries:
+                tank_names = [entry.name[:-4] for entry in entries
+                              if entry.name.endswith(".pkl") and entry.name[:-4] not in self.tanks and entry.is_file()]
+            if not tank_names:
+                return
+            with ThreadPoolExecutor(max_workers=min(self.load_concurrency, len(tank_names))) as executor:
+                # map は入力順に結果を返すため、タンクの登録順はファイルの列挙順のまま
+                for tank_name, tank in zip(tank_names, executor.map(self._restore_tank, tank_names)):
+                    if tank is not None:
+                        self.tanks[tank_name] = tank
+                        # 復元直後はファイルと同じ内容のため、保存済みとして扱う
+                        self._saved_generations[tank_name] = tank.shared_generation()
+
+    def _restore_tank(self, tank_name: str):
+        """
+        永続化ファイルから 1 つのタンクを復元して返します。失敗した場合は None を返します。
+        """
+        try:
+            # タンクの復元処理
+            tank = VecTank(tank_name)
+            # メタデータを読み込み、パラメータに従って共有メモリを生成
+            meta_path = os.path.join(self.store_dir, f"{tank_name}.pkl")
+            with open(meta_path, "rb") as f:
+                metadata = pickle.load(f)
+            print(f"[DEBUG] Loaded metadata for tank: {tank_name}")
+            tank._parse_params(metadata.get("params", {}))
+            tank.create_shared_memory()
+
+            # ベクトルデータの読み込み
+            vectors, scales = self._load_vector_files(tank_name)
+            rows = len(metadata) - 1  # "params" を除外
+            count = vectors.shape[0] if vectors is not None else 0
+            if count != rows:
+                # ベクトルとメタデータの行数が一致しない場合は、両方に存在する先頭の行までに揃える
+                print(f"[ERROR] Tank '{tank_name}': {count} vectors but {rows} metadata rows; "
+                      f"restoring the first {min(count, rows)} rows.")
+                count = min(count, rows)
+                metadata = dict(itertools.islice(metadata.items(), count + 1))
+            # 読み込んだメタデータを共有メモリへ書き込み
+            tank.metadata = metadata
+            tank._update_shared_metadata()
+            if vectors is not None:
+                vectors = vectors[:count]
+                if vectors.dtype.kind == "V":
+                    # bfloat16 は .npy 上で型情報を持たない（"|V2"）ため、同じビット列として解釈し直す
+                    vectors = vectors.view(tank.dtype)
+                tank.vectors[:count] = vectors
+                if tank.quantized:
+                    # int8 量子化タンクは各行のスケールも復元
+                    tank.scales[:count] = scales[:count]
+                tank._update_norms(0, count)
+                # メモリマップを閉じる
+                del vectors, scales
+
+            print(f"[DEBUG] Restored metadata for tank: {str(tank)}")
+            print(f"[DEBUG] Restored tank: {tank_name}")
+            return tank
+        except Exception as e:
+            print(f"[ERROR] Failed to restore tank '{tank_name}': {e}")
+            traceback.print_exc()
+            return None
+
+    def _vector_paths(self, tank_name: str):
+        """
+        タンクのベクトルデータとスケール（int8 量子化タンクのみ）の保存先パスを返します。
+        """
+        return (os.path.join(self.store_dir, f"{tank_name}.npy"),
+                os.path.join(self.store_dir, f"{tank_name}.scales.npy"))
+
+    def _load_vector_files(self, tank_name: str):
+        """
+        保存済みのベクトルデータとスケールを読み込みます。
+        .npy はメモリマップ（mmap_mode='r'）で開くため、実際の読み込みは共有メモリへのコピー時に行われます。
+        旧形式の .npz のみが存在する場合はそちらを読み込みます。
+        戻り値:
+          (ベクトルデータ, スケール) のタプル。存在しないものは None
+        """
+        vector_path, scale_path = self._vector_paths(tank_name)
+        # 存在確認（stat）を別途行わず、開けなかった場合に次の候補へ進む
+        try:
+            vectors = np.load(vector_path, mmap_mode="r")
+        except FileNotFoundError:
+            pass
+        else:
+            try:
+                scales = np.load(scale_path, mmap_mode="r")
+            except FileNotFoundError:
+                scales = None
+            return vectors, scales
+        legacy_path = os.path.join(self.store_dir, f"{tank_name}.npz")
+        try:
+            with np.load(legacy_path) as data:
+                return data["vectors"], data["scales"] if "scales" in data else None
+        except FileNotFoundError:
+            return None, None
+
+    def save_tank(self, tank_name: str):
+        """
+        タンクのベクトルデータ・スケール（int8 量子化タンクのみ）・メタデータをファイルに保存します。
+        保存内容はロック下でメモリ上に複製し、ファイルへの書き出しはロックを解放してから行います。
+        すべてのファイルを一時ファイルに書き出してからコミット印（{tank_name}.commit）を作成し、
+        os.replace で置き換えた後に印を削除します。置き換えの途中で強制終了しても、次回起動時に
+        印が残っていれば一時ファイルで置き換えを完了し、印がなければ一時ファイルを破棄するため、
+        新旧のベクトルデータとメタデータが混在することはありません。
+        """
+        with self._save_lock:
+            tank = self.tanks[tank_name]
+            # 同一プロセス内の書き込みと競合しないよう、読み取りロック下で保存内容をメモリ上に複製する
+            # （ファイルへの書き出しはロックの外で行い、ディスク I/O の間も追加・更新・削除を妨げない）
+            with VecTank._lock.read_lock():
+                generation, vectors, scales, meta_bytes = self._snapshot_tank(tank)
+                print(f"[DEBUG] Save tank: {str(tank)}")
+            # 保存先パスの作成
+            save_path_npy, save_path_scales = self._vector_paths(tank_name)
+            save_path_pkl = os.path.join(self.store_dir, f"{tank_name}.pkl")
+            # ベクトルデータは有効なデータ範囲のみ、メモリマップ可能な非圧縮の .npy で保存
+            # （int8 量子化タンクはスケールも保存）
+            # メタデータは最後に置き換える
+            files = [(save_path_npy, lambda f: np.save(f, vectors))]
+            if scales is not None:
+                files.append((save_path_scales, lambda f: np.save(f, scales)))
+            files.append((save_path_pkl, lambda f: f.write(meta_bytes)))
+            self._write_all_atomic(tank_name, files)
+            # 旧形式（.npz）のファイルが残っていれば削除
+            legacy_path = os.path.join(self.store_dir, f"{tank_name}.npz")
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+            # 保存した時点の世代番号を記録し、以降の変更の有無を判定できるようにする
+            self._saved_generations[tank_name] = generation
+        print(f"[DEBUG] Tank '{tank_name}' saved to files.")
+
+    def _snapshot_tank(self, tank: VecTank, timeout: float = 5.0):
+        """
+        タンクのベクトルデータ・スケール（int8 量子化タンクのみ）・メタデータ（pickle）をメモリ上に複製して返します。
+        VecTank の書き込みロックは同一プロセス内でのみ有効なため、他プロセスのクライアントによる書き込みとは
+        共有メモリ上の書き込み番号で整合を取ります。書き込み中（奇数）の場合や、複製の前後で番号が変わった場合は
+        複製をやり直し、削除で前詰めされたベクトルと更新前のメタデータのような組を保存しないようにします。
+        timeout 秒以内に書き込みの合間を取得できない場合（書き込み中のクライアントが異常終了した場合を含む）は
+        TimeoutError を送出します。
+        戻り値:
+          (世代番号, ベクトルデータ, スケール, メタデータの pickle) のタプル
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            sequence = tank.write_sequence()
+            if sequence % 2 == 0:
+                generation = tank.shared_generation()
+                try:
+                    tank._sync_shared_metadata()
+                    count = len(tank)
+                    vectors = tank.vectors[:count].copy()
+                    scales = tank.scales[:count].copy() if tank.quantized else None
+                    meta_bytes = pickle.dumps(tank.metadata, protocol=pickle.HIGHEST_PROTOCOL)
+                except Exception:
+                    # 複製中に書き込みが始まると、書き換え途中のメタデータを読み込めない場合がある
+                    if tank.write_sequence() == sequence:
+                        raise
+                else:
+                    if tank.write_sequence() == sequence:
+                        return generation, vectors, scales, meta_bytes
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Tank '{tank.tank_name}' did not become idle for a consistent snapshot.")
+            time.sleep(0.001)
+
+    def _commit_marker_path(self, tank_name: str) -> str:
+        """
+        保存の置き換え中であることを示すコミット印のパスを返します。
+        """
+        return os.path.join(self.store_dir, f"{tank_name}.commit")
+
+    def _write_all_atomic(self, tank_name: str, files: list):
+        """
+        files（(保存先パス, write(ファイルオブジェクト)) のリスト）をすべて一時ファイルに書き出した後、
+        コミット印を作成してから順に保存先へ置き換え、最後に印を削除します。
+        一時ファイルの内容と、印の作成・置き換えはそれぞれ fsync でディスクへ反映してから次へ進むため、
+        プロセスの強制終了だけでなく電源断・OS の異常終了でも途中の状態から復旧できます。
+        """
+        for path, write in files:
+            with open(f"{path}.tmp", "wb") as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+        # ここから先は一時ファイルがすべて揃っているため、中断しても起動時に置き換えを完了できる
+        marker_path = self._commit_marker_path(tank_name)
+        with open(marker_path, "wb"):
+            pass
+        self._fsync_store_dir()
+        for path, _ in files:
+            os.replace(f"{path}.tmp", path)
+        # 置き換えがディスクへ反映される前に印が消えないようにする
+        self._fsync_store_dir()
+        os.remove(marker_path)
+
+    def _fsync_store_dir(self):
+        """
+        store_dir 内でのファイルの作成・置き換え（ディレクトリのエントリの変更）をディスクへ反映します。
+        ディレクトリを開けない環境（Windows 等）ではなにもしません。
+        """
+        try:
+            fd = os.open(self.store_dir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _recover_interrupted_saves(self):
+        """
+        前回の保存が置き換えの途中で中断されていた場合に、ファイルの組を一貫した状態に戻します。
+        コミット印が残っているタンクは一時ファイルで置き換えを完了し、
+        印のない一時ファイル（書き出し途中で中断されたもの）は削除して前回保存時のファイルを残します。
+        """
+        with os.scandir(self.store_dir) as entries:
+            markers = [entry.name[:-len(".commit")] for entry in entries if entry.name.endswith(".commit")]
+        for tank_name in markers:
+            save_path_npy, save_path_scales = self._vector_paths(tank_name)
+            # メタデータを最後に置き換える（保存時と同じ順序）
+            for path in (save_path_npy, save_path_scales, os.path.join(self.store_dir, f"{tank_name}.pkl")):
+                if os.path.exists(f"{path}.tmp"):
+                    os.replace(f"{path}.tmp", path)
+            self._fsync_store_dir()
+            os.remove(self._commit_marker_path(tank_name))
+            print(f"[DEBUG] Completed interrupted save for tank: {tank_name}")
+        with os.scandir(self.store_dir) as entries:
+            leftovers = [entry.path for entry in entries if entry.name.endswith((".npy.tmp", ".pkl.tmp"))]
+        for path in leftovers:
+            os.remove(path)
+            print(f"[DEBUG] Removed incomplete save file: {path}")
+
+    def save_dirty_tanks(self) -> list:
+        """
+        永続化モードのタンクのうち、前回の保存（または復元）以降に変更されたものだけを保存します。
+        戻り値:
+          保存したタンク名のリスト
+        """
+        saved = []
+        for tank_name, tank in list(self.tanks.items()):
+            if not tank.persist or self._saved_generations.get(tank_name) == tank.shared_generation():
+                continue
+            try:
+                self.save_tank(tank_name)
+                saved.append(tank_name)
+            except Exception as e:
+                print(f"[ERROR] Failed to save tank '{tank_name}': {e}")
+                traceback.print_exc()
+        return saved
+
+    def _checkpoint_loop(self):
+        """
+        checkpoint_interval 秒ごとに、変更のあった永続化モードのタンクを保存します。
+        検索・更新の処理とは別スレッドで動作し、停止要求時に終了します。
+        """
+        while not self._stop_event.wait(self.checkpoint_interval):
+            self.save_dirty_tanks()
 
     def event_loop(self):
         """
         共有メモリ経由で VecTank 側からのコマンドを受信し、イベントループで処理を行う。
         対応コマンド:
-          - create,<tank_name>,<dim>,<persist>,<max_capacity>,<store_dir>
+          - create,<tank_name>,<dim>,<persist>,<max_capacity>,<single_meta_size>,<sim_method>[,<dtype>]
           - save,<tank_name>
+          - log,<tank_name>,<message>
+        各コマンドは対応する _handle_* メソッドで処理します。
         なお、コマンド処理後は共有メモリバッファを全0にクリアして完了通知とする。
         """
         print("[DEBUG] TankStore event loop started.")
         self._loop = True
+        # コマンド名 → 処理メソッド（コマンド名以降のフィールドのリストを受け取る）
+        handlers = {
+            "create": self._handle_create,
+            "save": self._handle_save,
+            "log": self._handle_log,
+        }
+        notified = True
         while not self._stop_event.is_set():
             if self._comm_buffer[0] != 0:
+                # 送信側はバッファへの書き込み後に通知するため、待機のタイムアウト直後は通知が届いていないことがある
+                # （届いていれば読み捨てて通知付きとして扱う）
+                notified = notified or self._wait_for_command(0)
+                self._unnotified_commands = 0 if notified else self._unnotified_commands + 1
+                if self._unnotified_commands >= 3 and self._poll_interval > 0.01:
+                    # FIFO で通知しない（または FIFO を開けない）クライアントからのコマンドが続く場合は、
+                    # 従来と同じ 10ms 間隔の確認で受け付ける
+                    print("[DEBUG] Commands arrived without wakeup notification; polling every 10 ms.")
+                    self._poll_interval = 0.01
                 # 共有メモリからコマンド文字列を取得（null-terminated とする）
                 raw_bytes = bytes(self._comm_buffer)
                 cmd = raw_bytes.split(b'\x00')[0].decode('utf-8')
                 print(f"[DEBUG] Received command: {cmd}")
 
-                parts = cmd.split(',')
-                command_name = parts[0].lower()
-                if command_name == "create":
-                    # コマンド例: "create,sample_tank,3,True,10000,/path/to/dir"
+                command_name, *args = cmd.split(',')
+                handler = handlers.get(command_name.lower())
+                if handler is None:
+                    print(f"[ERROR] Unknown command: {command_name}")
+                else:
                     try:
-                        if len(parts) >= 6:
-                            tank_name = parts[1]
-                            dim = int(parts[2])
-                            persist = True if parts[3].lower() == "true" else False
-                            max_capacity = int(parts[4])
-                            single_meta_size = int(parts[5])
-                            sim_method = parts[6]
-                            if tank_name in self.tanks:
-                                print(f"[DEBUG] Tank '{tank_name}' already exists.")
-                            else:
-                                self.create_tank(tank_name, dim, persist, max_capacity, single_meta_size, sim_method)
-                                print(f"[DEBUG] Tank '{tank_name}' created via create command.")
-                        else:
-                            print("[ERROR] Insufficient parameters for create command.")
+                        handler(args)
                     except Exception as e:
-                        print(f"[ERROR] Failed to process create command: {e}")
+                        # 1 つのコマンドの失敗でイベントループが停止しないようにする
+                        print(f"[ERROR] Failed to process {command_name} command: {e}")
                         traceback.print_exc()
-                elif command_name == "save":
-                    # コマンド例: "save,sample_tank"
-                    if len(parts) >= 2:
-                        tank_name = parts[1]
-                        if tank_name in self.tanks:
-                            try:
-                                tank = self.tanks[tank_name]
-                                tank._read_shared_metadata()
-                                tank._parse_params(tank.metadata.get("params", {}))
-                                print(f"[DEBUG] Save tank: {str(tank)}")
-                                # 保存先パスの作成
-                                save_path_npz = os.path.join(self.store_dir, f"{tank_name}.npz")
-                                save_path_pkl = os.path.join(self.store_dir, f"{tank_name}.pkl")
-                                # ベクトルデータは有効なデータ範囲のみ保存
-                                np.savez(save_path_npz, vectors=tank.vectors[:len(tank)])
-                                # メタデータ保存
-                                with open(save_path_pkl, "wb") as f:
-                                    pickle.dump(tank.metadata, f)
-                                print(f"[DEBUG] Tank '{tank_name}' saved to files.")
-                            except Exception as e:
-                                print(f"[ERROR] Failed to save tank '{tank_name}': {e}")
-                        else:
-                            print(f"[ERROR] Tank '{tank_name}' not found for saving.")
-                    else:
-                        print("[ERROR] Insufficient parameters for save command.")
-                elif command_name == "log":
-                    # コマンド例: "log,sample_tank,log_message"
-                    if len(parts) >= 3:
-                        print(f"[DEBUG] Log command received for tank: {parts[1]} with message: {parts[2]}")
-                        tank = self.tanks.get(parts[1])
-                        tank._read_shared_metadata()
-                        tank._parse_params(tank.metadata.get("params", {}))
-                        print(f"[DEBUG] Tank: {str(tank)}")
                 # コマンド処理後、共有バッファをクリア（全0に戻す）＝Ack とする
-                self._comm_buffer.fill(0)
+                # 送信側は先頭バイトで完了を判定するため、先頭バイトは最後にクリアする
+                self._comm_buffer[1:] = 0
+                self._comm_buffer[0] = 0
+            notified = self._wait_for_command()
+
+    def _handle_create(self, args: list):
+        """
+        create コマンドを処理します。
+        コマンド例: "create,sample_tank,3,True,10000,4096,COSINE,int8"
+        """
+        if len(args) < 6:
+            print("[ERROR] Insufficient parameters for create command.")
+            return
+        tank_name = args[0]
+        dim = int(args[1])
+        persist = args[2].lower() == "true"
+        max_capacity = int(args[3])
+        single_meta_size = int(args[4])
+        sim_method = args[5]
+        dtype = args[6] if len(args) >= 7 else "float32"
+        if tank_name in self.tanks:
+            print(f"[DEBUG] Tank '{tank_name}' already exists.")
+        else:
+            self.create_tank(tank_name, dim, persist, max_capacity, single_meta_size, sim_method, dtype)
+            print(f"[DEBUG] Tank '{tank_name}' created via create command.")
+
+    def _handle_save(self, args: list):
+        """
+        save コマンドを処理します。
+        コマンド例: "save,sample_tank"
+        """
+        if len(args) < 1:
+            print("[ERROR] Insufficient parameters for save command.")
+            return
+        tank_name = args[0]
+        if tank_name not in self.tanks:
+            print(f"[ERROR] Tank '{tank_name}' not found for saving.")
+            return
+        self.save_tank(tank_name)
+
+    def _handle_log(self, args: list):
+        """
+        log コマンドを処理します。
+        コマンド例: "log,sample_tank,log_message"
+        """
+        if len(args) < 2:
+            return
+        print(f"[DEBUG] Log command received for tank: {args[0]} with message: {args[1]}")
+        tank = self.tanks.get(args[0])
+        if tank is None:
+            print(f"[ERROR] Tank '{args[0]}' not found for logging.")
+            return
+        tank._sync_shared_metadata()
+        print(f"[DEBUG] Tank: {str(tank)}")
+
+    def _open_wakeup_fifo(self):
+        """
+        コマンド到着の通知用 FIFO を生成して開き、ファイル記述子を返します。
+        FIFO のパスは誰でも書き込める /tmp 上の予測可能な名前のため、他のユーザーが同じパスに
+        ファイルやリンクを置いている等で生成・オープンできない場合は、例外を送出せずに None を返します
+        （イベントループは通知を使わず、一定間隔でバッファを確認します）。
+        """
+        try:
+            try:
+                # 前回の起動時に残った FIFO を削除（他のユーザーのファイルは削除できずに PermissionError となる）
+                os.remove(self._wakeup_path)
+            except FileNotFoundError:
+                pass
+            os.mkfifo(self._wakeup_path, 0o600)
+        except OSError as e:
+            print(f"[ERROR] Failed to create wakeup FIFO '{self._wakeup_path}': {e}. Falling back to polling.")
+            # 自身が生成していないパスは終了時に削除しない
+            self._wakeup_path = None
+            return None
+        try:
+            # 読み書き両用で開き、書き込み側が 1 つも開いていない間も EOF（常に読み出し可能）とならないようにする
+            fd = os.open(self._wakeup_path, os.O_RDWR | os.O_NONBLOCK | os.O_NOFOLLOW)
+        except OSError as e:
+            print(f"[ERROR] Failed to open wakeup FIFO '{self._wakeup_path}': {e}. Falling back to polling.")
+            return None
+        if not stat.S_ISFIFO(os.fstat(fd).st_mode):
+            print(f"[ERROR] Wakeup path '{self._wakeup_path}' is not a FIFO. Falling back to polling.")
+            os.close(fd)
+            return None
+        return fd
+
+    def _wait_for_command(self, timeout: float = None):
+        """
+        次のコマンドが届くまで待機します。
+        FIFO が利用できる場合は、VecTank からの通知（または停止要求）があるまでブロックするため、
+        待機中に CPU を消費せず、コマンド到着後すぐに処理を開始できます。
+        通知を送らないクライアントにも対応できるよう、timeout 秒（省略時は _poll_interval 秒）ごとにバッファも確認します。
+        timeout=0 の場合は待機せず、未読の通知の有無のみを確認します。
+        戻り値: 通知によって起こされた場合は True
+        """
+        if self._wakeup_fd is None:
             time.sleep(0.01)
+            return True
+        readable, _, _ = select.select([self._wakeup_fd], [], [],
+                                       self._poll_interval if timeout is None else timeout)
+        if readable:
+            try:
+                # 溜まった通知をまとめて読み捨てる（コマンドはバッファ側で確認する）
+                os.read(self._wakeup_fd, 4096)
+            except BlockingIOError:
+                pass
+        return bool(readable)
 
     def stop_event_loop(self):
         """
         イベントループの終了を要求し、共有メモリを解放する
         """
         self._stop_event.set()
+        # FIFO で待機中のイベントループを起こす
+        if self._wakeup_fd is not None:
+            os.write(self._wakeup_fd, b"\x01")
         self._event_thread.join()
+        if self._checkpoint_thread is not None:
+            self._checkpoint_thread.join()
         self.close()
         self.unlink()
         self._loop = False
@@ -230,24 +566,32 @@ class TankStore:
         for tank in self.tanks.values():
             # タンクの共有メモリを解放
             try:
-                tank.shm.close()
-                tank.meta_shm.close()
+                for block in tank._shared_memories():
+                    block.close()
             except Exception:
                 pass
         self._comm_shm.close()
+        if self._wakeup_fd is not None:
+            os.close(self._wakeup_fd)
+            self._wakeup_fd = None
 
     def unlink(self):
         for tank in self.tanks.values():
             # タンクの共有メモリを解放
             try:
-                tank.shm.unlink()
-                tank.meta_shm.unlink()
+                for block in tank._shared_memories():
+                    block.unlink()
             except Exception as e:
                 pass
         try:
             self._comm_shm.unlink()
         except FileNotFoundError:
             pass
+        if self._wakeup_path is not None:
+            try:
+                os.remove(self._wakeup_path)
+            except FileNotFoundError:
+                pass
 
     def __enter__(self):
         return self
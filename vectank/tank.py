@@ -2,12 +2,18 @@
 【概要】
   本ファイルには、共有メモリを利用してベクトルとメタデータの管理を行う VecTank クラスが定義されています。
   ・固定サイズの NumPy 配列を共有メモリ上に確保し、各操作（追加、複数追加、検索、更新、削除、フィルタ、クリア）を実装。
-  ・persist=True の場合、指定ディレクトリ内に「タンク名.npz」「タンク名.pkl」として永続化ファイルを生成し、状態を保持／復元します。
+  ・persist=True の場合、指定ディレクトリ内に「タンク名.npy」「タンク名.pkl」として永続化ファイルを生成し、状態を保持／復元します。
+  ・各ベクトルの L2 ノルムも共有メモリ上に保持し、コサイン類似度の検索時に行列を再走査せずに済むようにしています。
+  ・dtype="int8" を指定すると、ベクトルを各行ごとのスケール付きで int8 に量子化して保持します（メモリ使用量・検索時の転送量が 1/4）。
+  ・dtype="float16" / "bfloat16" を指定すると、ベクトルを 16bit 浮動小数点で保持します（メモリ使用量・検索時の転送量が 1/2）。
+    bfloat16 の利用には ml_dtypes（pip install VecTank[bf16]）が必要です。
+  ・query_cache_size を指定すると、同一クエリに対する search の結果をプロセスごとの LRU キャッシュから返します。
 
 【主なメソッド】
   - add_vector: 単一のベクトルとメタデータを追加
   - add_vectors: 複数のベクトルと対応するメタデータを一括追加
   - search: 指定した類似度計算方式によりクエリに近いベクトルを検索（SIM_METHODS を参照）
+  - search_batch: 複数のクエリを 1 回の行列積でまとめて検索
   - update_vector: 指定キーのベクトルとメタデータを更新
   - filter_by_metadata: 指定条件に合致するメタデータを持つベクトルのキー一覧を返す
   - delete, delete_keys: 単一または複数のベクトル削除後、内部データを再構築
@@ -15,24 +21,59 @@
   - __str__: タンクの基本情報を文字列で返す（デバッグ用）
   
 【注意点】
-  - 全操作はロックによる排他制御下で行われ、複数のスレッド／プロセス間の同時アクセスに対応しています。
+  - 全操作はリーダー・ライターロック（RWLock）の制御下で行われ、複数のスレッド／プロセス間の同時アクセスに対応しています。
+    検索・取得・フィルタは互いに並行して実行され、追加・更新・削除・クリアのみが排他となります。
   - ベクトルのキーは「1-indexed」の文字列で自動採番されます。
 """
 
+import itertools
 import os
 import pickle
+import stat
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 import numpy as np
 from multiprocessing import shared_memory, Lock
-from vectank.core import SIM_METHODS  # 類似度計算関数群
+from vectank.core import SIM_METHODS, quantize_int8, row_norms, select_top_k  # 類似度計算関数群
+from vectank.rwlock import RWLock
 import time
-import copy
 import json
 
+# meta_shm の先頭に置くヘッダ（リトルエンディアンの uint64 × 3）
+#   - pickle データ長
+#   - 世代番号（メタデータの書き込みごとに 1 増える。TankStore が未保存の変更の有無を判定するのに利用）
+#   - 書き込み番号（追加・更新・削除・クリアの開始時と終了時に 1 ずつ増え、奇数の間は書き込み中を表す。
+#     TankStore が他プロセスの書き込みと重ならない保存内容を取得するのに利用）
+_META_HEADER = struct.Struct("<QQQ")
+# ヘッダ内の書き込み番号の位置
+_WRITE_SEQUENCE = struct.Struct("<Q")
+_WRITE_SEQUENCE_OFFSET = _META_HEADER.size - _WRITE_SEQUENCE.size
+# 指定された計算方式の文字列（"COSINE" など、大文字・小文字はそのまま）→ 類似度計算関数
+# 検索ごとの lower() と SIM_METHODS の検査を省くため、一度解決した文字列を記録する
+_SIM_FUNCTIONS = {}
+
+def wakeup_path(store_name: str) -> str:
+    """
+    TankStore へのコマンド到着を通知する名前付きパイプ（FIFO）のパスを返します。
+    TankStore はこの FIFO からの読み出しで待機し、VecTank はコマンド書き込み後に 1 バイト書き込んで起こします。
+    サーバとクライアントで TMPDIR 等の環境変数が異なっても同じパスになるよう、/tmp があればそれを使います。
+    """
+    directory = "/tmp" if os.path.isdir("/tmp") else tempfile.gettempdir()
+    return os.path.join(directory, f"vectank_{store_name}.wakeup")
+
 class VecTank:
-    _lock = Lock()
+    # 検索・取得・フィルタは並行実行し、追加・更新・削除のみ排他とするリーダー・ライターロック
+    _lock = RWLock()
+    # TankStore との通信用バッファへのコマンド送信を直列化するロック
+    _comm_lock = Lock()
+    # ベクトルの格納に利用できる型
+    SUPPORTED_DTYPES = ("float32", "float16", "bfloat16", "int8")
     
     def __init__(self, tank_name: str, dim: int = 1200, max_capacity: int = 100000, single_meta_size: int = 4096,
-                 persist: bool = False, sim_method: str = "COSINE"):
+                 persist: bool = False, sim_method: str = "COSINE", dtype: str = "float32", query_cache_size: int = 0):
         """
         コンストラクタ
           tank_name: タンクの名称
@@ -40,13 +81,40 @@ class VecTank:
           max_capacity: タンクに格納可能な最大ベクトル数
           persist: 永続化モード（ただし、ファイル操作は TankStore に依存）
           store_dir: 永続化に用いるディレクトリ（ファイル操作は外部で実施）
+          dtype: ベクトルの格納型（"float32"、"float16"、"bfloat16" または "int8"。int8 の場合は各行ごとのスケール付きで量子化）
+          query_cache_size: search 結果を保持する LRU キャッシュの件数（0 の場合は無効）
         """
         self.tank_name = tank_name
         self.dim = dim
         self.max_capacity = max_capacity
         self.persist = persist
         self.sim_method = sim_method
-        self.dtype = np.dtype("float32")
+        unsupported = f"Unsupported dtype: {dtype} (supported: {', '.join(self.SUPPORTED_DTYPES)})"
+        try:
+            self.dtype = np.dtype(dtype)
+        except TypeError:
+            if dtype == "bfloat16":
+                # "bfloat16" は ml_dtypes の import 時にのみ NumPy へ登録される
+                raise ValueError(f"Unsupported dtype: {dtype} (bfloat16 の利用には ml_dtypes が必要です)")
+            raise ValueError(unsupported)
+        if self.dtype.name not in self.SUPPORTED_DTYPES:
+            raise ValueError(unsupported)
+        # int8 量子化時の各行のスケール（float32 の場合は None）
+        self.scales = None
+        # filter_by_metadata 用のメタデータ列キャッシュ（フィールド名 → 行順の値の配列）
+        self._meta_columns = {}
+        # filter_by_metadata 用の転置インデックス（フィールド名 → {値: 行番号のリスト}。値がハッシュ不可なら None）
+        self._meta_indexes = {}
+        # search 結果の LRU キャッシュ（(クエリのバイト列, top_k, 計算方式) → 結果リスト）
+        # 共有メモリ上ではなくインスタンスごとに保持し、このインスタンス経由の更新時に破棄する
+        self._query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        # 読み取りロックは複数スレッドで同時に取得されるため、キャッシュの操作はこのロックで直列化する
+        self._query_cache_lock = threading.Lock()
+        # キャッシュ済みの結果がどの世代の共有メモリから計算されたか
+        self._query_cache_generation = None
+        # self.metadata が共有メモリ上のどの世代と一致しているか（未同期なら None）
+        self._metadata_generation = None
         # 各ベクトルに対応するメタデータを保持する辞書
         self.metadata = {}
         # 共有メモリでメタデータ同期用の固定サイズバッファ確保（サイズは必要に応じて調整）
@@ -69,13 +137,24 @@ class VecTank:
         共有メモリのサイズは、最大ベクトル数と次元数に基づいて計算されます。
         共有メモリの名前は、TankStore 側で指定されたものを使用します。
         """
-        # 共有メモリ上に確保するバイト数を計算（float32 固定）
+        # 共有メモリ上に確保するバイト数を計算（格納型のバイト数に依存）
         size = self.max_capacity * self.dim * self.dtype.itemsize
         # 共有メモリブロックの生成（create=True）
         self.shm = shared_memory.SharedMemory(name=f"{self.tank_name}_vector", create=True, size=size)
         # 共有メモリ上の NumPy 配列としてベクトルデータを管理
         self.vectors = np.ndarray((self.max_capacity, self.dim), dtype=self.dtype, buffer=self.shm.buf)
         self.vectors.fill(0)
+        # 各ベクトルの L2 ノルムを保持する共有メモリブロックを生成（create=True）
+        self.norm_shm = shared_memory.SharedMemory(name=f"{self.tank_name}_norm", create=True,
+                                                   size=self.max_capacity * np.dtype("float32").itemsize)
+        self.norms = np.ndarray((self.max_capacity,), dtype=np.float32, buffer=self.norm_shm.buf)
+        self.norms.fill(0)
+        if self.quantized:
+            # int8 量子化時は各行のスケールを保持する共有メモリブロックを生成（create=True）
+            self.scale_shm = shared_memory.SharedMemory(name=f"{self.tank_name}_scale", create=True,
+                                                        size=self.max_capacity * np.dtype("float32").itemsize)
+            self.scales = np.ndarray((self.max_capacity,), dtype=np.float32, buffer=self.scale_shm.buf)
+            self.scales.fill(0)
         # メタデータ用の共有メモリサイズを計算
         self._meta_shm_size = self._meta_shm_single_size * self.max_capacity
         # メタデータ用の共有メモリブロックを生成（create=True）
@@ -86,42 +165,158 @@ class VecTank:
     def _update_shared_metadata(self):
         """
         self.metadata の内容を pickle 化して、共有メモリ meta_shm に書き込みます。
+        先頭にデータ長のヘッダを置き、バッファ全体のゼロクリアは行いません。
         """
-        meta_bytes = pickle.dumps(self.metadata)
-        if len(meta_bytes) > self._meta_shm_size:
+        # メタデータが変更されたため、フィルタ用の列キャッシュと検索結果のキャッシュを破棄
+        self._clear_metadata_caches()
+        # 最新のバイナリプロトコルで直列化し、書き込み・読み出しの量と時間を抑える
+        meta_bytes = pickle.dumps(self.metadata, protocol=pickle.HIGHEST_PROTOCOL)
+        header_size = _META_HEADER.size
+        if header_size + len(meta_bytes) > self._meta_shm_size:
             raise MemoryError("Serialized metadata exceeds shared memory size.")
-        # 共有メモリバッファをクリアし、シリアライズしたデータを書き込み
-        self.meta_shm.buf[:self._meta_shm_size] = b'\x00' * self._meta_shm_size
-        self.meta_shm.buf[:len(meta_bytes)] = meta_bytes
+        # シリアライズしたデータを書き込んだ後、データ長と世代番号のヘッダを更新
+        self.meta_shm.buf[header_size:header_size + len(meta_bytes)] = meta_bytes
+        generation = self.shared_generation() + 1
+        _META_HEADER.pack_into(self.meta_shm.buf, 0, len(meta_bytes), generation, self.write_sequence())
+        self._metadata_generation = generation
+
+    def shared_generation(self) -> int:
+        """
+        共有メモリ上のメタデータの世代番号を返します。
+        追加・更新・削除・クリアのたびに増加するため、前回参照時から変更があったかどうかの判定に利用できます。
+        """
+        return _META_HEADER.unpack_from(self.meta_shm.buf, 0)[1]
+
+    def write_sequence(self) -> int:
+        """
+        共有メモリ上の書き込み番号を返します。
+        奇数の間はいずれかのインスタンスがベクトル・メタデータを書き込み中であり、
+        読み出しの前後で値が同じであれば、その間に書き込みがなかったことを表します。
+        """
+        return _WRITE_SEQUENCE.unpack_from(self.meta_shm.buf, _WRITE_SEQUENCE_OFFSET)[0]
+
+    @contextmanager
+    def _shared_write(self):
+        """
+        書き込みロックを取得し、共有メモリへの書き込みの前後で書き込み番号を 1 ずつ増やします。
+        書き込みロックは同一プロセス内でのみ有効なため、他プロセスの TankStore は書き込み番号で
+        書き込み中かどうか、読み出しの途中で書き込みがあったかどうかを判定します。
+        """
+        with self.__class__._lock.write_lock():
+            _WRITE_SEQUENCE.pack_into(self.meta_shm.buf, _WRITE_SEQUENCE_OFFSET, self.write_sequence() + 1)
+            try:
+                yield
+            finally:
+                _WRITE_SEQUENCE.pack_into(self.meta_shm.buf, _WRITE_SEQUENCE_OFFSET, self.write_sequence() + 1)
+
+    @property
+    def quantized(self) -> bool:
+        """
+        ベクトルを int8 に量子化して保持しているかどうかを返します。
+        """
+        return self.dtype == np.int8
+
+    def _shared_memories(self) -> list:
+        """
+        このタンクが利用している共有メモリブロックの一覧を返します。
+        """
+        blocks = [self.shm, self.norm_shm, self.meta_shm]
+        if self.quantized:
+            blocks.append(self.scale_shm)
+        return blocks
+
+    def _row_values(self) -> list:
+        """
+        ベクトルの各行に対応付いた補助配列（L2 ノルム、int8 の場合はスケール）の一覧を返します。
+        削除時の前詰めやクリア時に、ベクトルと同じ行位置で扱う必要があります。
+        """
+        if self.quantized:
+            return [self.norms, self.scales]
+        return [self.norms]
+
+    def _write_rows(self, start: int, vectors: np.ndarray):
+        """
+        vectors（形状 (n, dim)）を start 行目から書き込み、スケール（int8 の場合）と L2 ノルムを更新します。
+        """
+        stop = start + vectors.shape[0]
+        if self.quantized:
+            self.vectors[start:stop], self.scales[start:stop] = quantize_int8(vectors)
+        else:
+            self.vectors[start:stop] = vectors
+        self._update_norms(start, stop)
+
+    def _decode_rows(self, start: int, stop: int) -> np.ndarray:
+        """
+        vectors[start:stop] を float32 の値として返します（int8 の場合はスケールを掛けて復元）。
+        float32 の場合はコピーせず共有メモリ上のビューを返します。
+        """
+        if self.quantized:
+            return self.vectors[start:stop] * self.scales[start:stop, np.newaxis]
+        return self.vectors[start:stop].astype(np.float32, copy=False)
+
+    def _update_norms(self, start: int, stop: int):
+        """
+        vectors[start:stop] の L2 ノルムを計算し、共有メモリ上の norms に書き込みます。
+        """
+        self.norms[start:stop] = row_norms(self._decode_rows(start, stop))
 
     def attach_shared_memory(self):
         """
         VecTank 側でTankStore側のタンクを取得する際に呼び出されるメソッド。
         """
-        # 共有メモリブロックの生成（create=True）
-        self.shm = shared_memory.SharedMemory(name=f"{self.tank_name}_vector", create=False)
-        # 共有メモリ上の NumPy 配列としてベクトルデータを管理
-        self.vectors = np.ndarray((self.max_capacity, self.dim), dtype=self.dtype, buffer=self.shm.buf)
-        # メタデータ用の共有メモリブロックを生成（create=True）
+        # メタデータ用の共有メモリブロックにアタッチし、先にパラメータ（次元数・最大容量など）を復元
         self.meta_shm = shared_memory.SharedMemory(name=f"{self.tank_name}_meta", create=False)
         self.metadata = self._read_shared_metadata()
         self._parse_params(self.metadata.get("params"))
+        # ベクトル用の共有メモリブロックにアタッチ
+        self.shm = shared_memory.SharedMemory(name=f"{self.tank_name}_vector", create=False)
+        # 共有メモリ上の NumPy 配列としてベクトルデータを管理
+        self.vectors = np.ndarray((self.max_capacity, self.dim), dtype=self.dtype, buffer=self.shm.buf)
+        # L2 ノルム用の共有メモリブロックにアタッチ
+        self.norm_shm = shared_memory.SharedMemory(name=f"{self.tank_name}_norm", create=False)
+        self.norms = np.ndarray((self.max_capacity,), dtype=np.float32, buffer=self.norm_shm.buf)
+        if self.quantized:
+            # int8 量子化時はスケール用の共有メモリブロックにアタッチ
+            self.scale_shm = shared_memory.SharedMemory(name=f"{self.tank_name}_scale", create=False)
+            self.scales = np.ndarray((self.max_capacity,), dtype=np.float32, buffer=self.scale_shm.buf)
 
     def _read_shared_metadata(self):
         """
         共有メモリ meta_shm から pickle 化された辞書を読み出して
         元の self.metadata に戻し、返します。
         """
-        # 1) バッファ全体をバイト列として取得
-        raw = self.meta_shm.buf
-        # 2) trailing '\x00' を除去（write時に余白をゼロクリアしているため）
-        pickled = bytes(raw).rstrip(b'\x00')
-        # 3) pickle をアンロードして辞書に戻す
-        metadata = pickle.loads(pickled)
+        # 1) 先頭のヘッダからデータ長を取得
+        header_size = _META_HEADER.size
+        length, generation, _ = _META_HEADER.unpack_from(self.meta_shm.buf, 0)
+        # 2) データ部分のみを（コピーせずに）pickle からアンロードして辞書に戻す
+        with self.meta_shm.buf[header_size:header_size + length] as pickled:
+            metadata = pickle.loads(pickled)
         # 必要なら self.metadata を更新してもよい
         self.metadata = metadata
+        self._metadata_generation = generation
+        self._clear_metadata_caches()
         return metadata
+
+    def _clear_metadata_caches(self):
+        """
+        メタデータから作成したキャッシュ（filter_by_metadata 用の列・転置インデックスと search の結果）を破棄します。
+        TankStore の保存・ログ処理では読み取りロック下で呼ばれ、並行する search と競合するため、
+        キャッシュの他の操作と同じく _query_cache_lock の下で行います。
+        """
+        with self._query_cache_lock:
+            self._meta_columns = {}
+            self._meta_indexes = {}
+            self._query_cache.clear()
     
+    def _sync_shared_metadata(self):
+        """
+        共有メモリ上のメタデータが前回の読み書き以降に更新されている場合のみ、
+        self.metadata とパラメータを読み直します（世代番号が同じなら pickle の読み込みを省略）。
+        """
+        if self.shared_generation() != self._metadata_generation:
+            self._read_shared_metadata()
+            self._parse_params(self.metadata.get("params", {}))
+
     def _parse_params(self, params: dict):
         """
         共有メモリから読み込んだメタデータのパラメータをインスタンス変数に設定します。
@@ -149,8 +344,9 @@ class VecTank:
     def send_command_to_store(cls, command: str, store_name: str = "tankstore_comm", timeout: float = 5.0) -> bool:
         """
         TankStore との通信用共有メモリ (store_name) に対してコマンドを送信します。
-        コマンド送信後、共有メモリバッファ（uint8 配列）が全0になるまでポーリングし、
+        コマンド送信後、共有メモリバッファ（uint8 配列）の先頭バイトが 0 に戻るまでポーリングし、
         完了（Ack）したかどうかを返します。
+        ポーリング間隔は短い間隔から倍々に延ばす（最大 10ms）ため、すぐに処理されるコマンドは待たずに完了します。
         """
         from multiprocessing import shared_memory
         import numpy as np, time
@@ -161,187 +357,362 @@ class VecTank:
             print(f"[ERROR] Communication SHM '{store_name}' not found.")
             return False
 
-        with cls._lock:
+        with cls._comm_lock:
             comm_buffer = np.ndarray((1024,), dtype=np.uint8, buffer=comm_shm.buf)
             # 送信前にバッファをクリア
             comm_buffer.fill(0)
             cmd_bytes = command.encode('utf-8') + b'\x00'
-            comm_buffer[:len(cmd_bytes)] = np.frombuffer(cmd_bytes, dtype=np.uint8)
+            # TankStore は先頭バイトでコマンドの到着を判定するため、先頭バイトは最後に書き込む
+            comm_buffer[1:len(cmd_bytes)] = np.frombuffer(cmd_bytes, dtype=np.uint8, offset=1)
+            comm_buffer[0] = cmd_bytes[0]
+            cls._notify_store(store_name)
             print(f"[DEBUG] Command '{command}' sent to TankStore using shared mem '{store_name}'. Waiting for acknowledgment...")
 
-            start_time = time.time()
-            while time.time() - start_time < timeout:
-                if not np.any(comm_buffer):
+            deadline = time.monotonic() + timeout
+            delay = 0.0001
+            while time.monotonic() < deadline:
+                if comm_buffer[0] == 0:
                     print("[DEBUG] Acknowledgment received from TankStore.")
                     comm_shm.close()
                     return True
-                time.sleep(0.01)
+                time.sleep(delay)
+                delay = min(delay * 2, 0.01)
             print("[ERROR] Acknowledgment not received within timeout.")
             comm_shm.close()
         return False
 
+    @staticmethod
+    def _notify_store(store_name: str):
+        """
+        TankStore の待機用 FIFO に 1 バイト書き込み、イベントループを起こします。
+        FIFO が存在しない環境（Windows 等）ではなにもせず、TankStore 側の定期的な確認に任せます。
+        """
+        if not hasattr(os, "mkfifo"):
+            # os.O_NONBLOCK も存在しないため、開く前に戻る
+            return
+        try:
+            # シンボリックリンクはたどらない（/tmp 上の予測可能なパスのため、他のユーザーが置いたリンク先を書き換えない）
+            fd = os.open(wakeup_path(store_name), os.O_WRONLY | os.O_NONBLOCK | os.O_NOFOLLOW)
+        except OSError:
+            return
+        try:
+            if not stat.S_ISFIFO(os.fstat(fd).st_mode):
+                # FIFO 以外（TankStore が FIFO を生成できず、同じパスに通常ファイルが置かれている等）には書き込まない
+                return
+            os.write(fd, b"\x01")
+        except BlockingIOError:
+            # パイプが満杯＝未処理の通知が既にあるため、追加の通知は不要
+            pass
+        finally:
+            os.close(fd)
+
     @classmethod
     def create_tank(cls, tank_name: str, dim: int, persist: bool = False,
-                    max_capacity: int = 10000, store_name: str = "tankstore_comm", single_meta_size: int = 4096, sim_method: str = "COSINE") -> "VecTank":
+                    max_capacity: int = 10000, store_name: str = "tankstore_comm", single_meta_size: int = 4096, sim_method: str = "COSINE",
+                    dtype: str = "float32", query_cache_size: int = 0) -> "VecTank":
         """
         TankStore 側に通信して新規タンクを生成し、生成されたタンクインスタンスを返します。
         store_name を指定することで、複数サーバ環境での利用が可能となります。
+        dtype="int8" を指定すると、ベクトルを int8 に量子化して保持するタンクを生成します。
+        dtype="float16" / "bfloat16" を指定すると、ベクトルを 16bit 浮動小数点で保持するタンクを生成します。
         """
 
-        create_cmd = f"create,{tank_name},{dim},{persist},{max_capacity},{single_meta_size},{sim_method}"
+        # 先にインスタンスを生成し、dtype 等の検証をコンストラクタと同じ経路（ValueError）で行う
+        dummy = cls(tank_name, dim, max_capacity, single_meta_size, persist, sim_method, dtype,
+                    query_cache_size=query_cache_size)
+        create_cmd = f"create,{tank_name},{dim},{persist},{max_capacity},{single_meta_size},{sim_method},{dummy.dtype.name}"
         if not cls.send_command_to_store(create_cmd, store_name=store_name):
             print("[ERROR] TankStore did not acknowledge tank creation.")
             return None
 
         print(f"[DEBUG] Tank '{tank_name}' created and restored via TankStore.")
-        dummy = cls(tank_name, dim, max_capacity, single_meta_size, persist, sim_method)
         dummy.attach_shared_memory()
         dummy.store_name = store_name
         return dummy
 
     @classmethod
-    def get_tank(cls, tank_name: str, store_name: str = "tankstore_comm") -> "VecTank":
+    def get_tank(cls, tank_name: str, store_name: str = "tankstore_comm", query_cache_size: int = 0) -> "VecTank":
         """
         TankStore 側に通信して、既存のタンクを取得して返します。
         store_name を指定することで、複数サーバ環境での利用が可能となります。
+        query_cache_size を指定すると、search 結果の LRU キャッシュを有効にします。
         """
-        dummy = cls(tank_name)
+        dummy = cls(tank_name, query_cache_size=query_cache_size)
         dummy.attach_shared_memory()
         dummy.store_name = store_name
         return dummy
 
-    def add_vector(self, vector: np.ndarray, meta: dict):
+    def add_vector(self, vector: np.ndarray, meta: dict = None):
         """
         単一のベクトルおよび紐づくメタデータを追加する。
-          vector: 形状 (dim,) の NumPy 配列（float32 に変換されます）
-          meta: ベクトルに関連付いたメタデータの辞書
+          vector: 形状 (dim,) の NumPy 配列（タンクの格納型に変換されます）
+          meta: ベクトルに関連付いたメタデータの辞書（省略時は None）
         戻り値: 自動採番されたキー（1-indexed の文字列）
         """
-        with self.__class__._lock:
+        with self._shared_write():
             num_vectors = len(self)
             if num_vectors >= self.max_capacity:
                 raise MemoryError("Tank capacity reached.")
             if vector.shape != (self.dim,):
                 raise ValueError(f"Vector shape must be ({self.dim},).")
-            vec = vector.astype(self.dtype, copy=False)
-            self.vectors[num_vectors, :] = vec
+            self._write_rows(num_vectors, vector[np.newaxis, :])
             key = str(num_vectors + 1)
             self.metadata[key] = meta
             self._update_shared_metadata()
         return key
 
-    def add_vectors(self, vectors: np.ndarray, metadata_list: list) -> list:
-        with self.__class__._lock:
+    def add_vectors(self, vectors: np.ndarray, metadata_list: list = None) -> list:
+        """
+        複数のベクトルおよび紐づくメタデータを一括追加する。
+          vectors: 形状 (n, dim) の NumPy 配列（タンクの格納型に変換されます）
+          metadata_list: 各ベクトルのメタデータのリスト。None の場合はメタデータなし（各キーの値は None）で登録し、
+                         呼び出し側で n 個の辞書を生成するコストを省けます
+        戻り値: 自動採番されたキー（1-indexed の文字列）のリスト
+        """
+        with self._shared_write():
             n = vectors.shape[0]
             if vectors.shape[1] != self.dim:
                 raise ValueError(f"Each vector must have {self.dim} dimensions.")
-            if len(metadata_list) != n:
+            if metadata_list is not None and len(metadata_list) != n:
                 raise ValueError("Length of metadata_list must match number of vectors.")
-            new_keys = []
             num_vectors = len(self)
             if num_vectors + n > self.max_capacity:
                 raise MemoryError("Adding vectors exceeds capacity.")
-            for i in range(n):
-                key = str(num_vectors + i + 1)
-                vec = vectors[i].astype(self.dtype, copy=False)
-                self.vectors[num_vectors + i, :] = vec
-                self.metadata[key] = metadata_list[i]
-                new_keys.append(key)
+            self._write_rows(num_vectors, vectors)
+            # キーは 1 回の map でまとめて生成し、メタデータは dict.update で一括登録
+            new_keys = list(map(str, range(num_vectors + 1, num_vectors + n + 1)))
+            if metadata_list is None:
+                self.metadata.update(dict.fromkeys(new_keys))
+            else:
+                self.metadata.update(zip(new_keys, metadata_list))
             self._update_shared_metadata()
 
         return new_keys
 
     def get(self, key: str):
-        with self.__class__._lock:
+        with self.__class__._lock.read_lock():
             idx = int(key) - 1
-            results = (key, self.vectors[idx].copy(), self.metadata.get(key))
+            results = (key, self._decode_rows(idx, idx + 1)[0].copy(), self.metadata.get(key))
 
         return results
 
+    def _scores(self, queries: np.ndarray, sim_method: str, num_vectors: int) -> np.ndarray:
+        """
+        クエリ（形状 (dim,) または (q, dim)）と先頭 num_vectors 件のベクトルとの類似度スコアを計算します。
+        呼び出し側でロックを取得済みであることを前提とします。
+        """
+        method = sim_method if sim_method is not None else self.sim_method
+        fun = _SIM_FUNCTIONS.get(method)
+        if fun is None:
+            method_key = method.lower()
+            if method_key not in SIM_METHODS:
+                raise ValueError(f"Unsupported similarity method: {method}")
+            fun = _SIM_FUNCTIONS[method] = SIM_METHODS[method_key]
+        data = self.vectors[:num_vectors]
+        scales = self.scales[:num_vectors] if self.quantized else None
+        return fun(data, queries.astype(np.float32, copy=False), norms=self.norms[:num_vectors], scales=scales)
+
+    def _top_k_results(self, scores: np.ndarray, top_k: int) -> list:
+        """
+        1 クエリ分のスコアから上位 top_k 件の (キー, スコア, ベクトル, メタデータ) のリストを作成します。
+        """
+        indices = select_top_k(scores, top_k)
+        # 上位 top_k 行は 1 回のインデックス参照でまとめて取り出す（共有メモリから切り離したコピーになる）
+        if self.quantized:
+            rows = self.vectors[indices] * self.scales[indices, np.newaxis]
+        else:
+            rows = self.vectors[indices].astype(np.float32, copy=False)
+        keys = [str(i + 1) for i in indices.tolist()]
+        metadata = self.metadata
+        return [(key, score, row, metadata.get(key))
+                for key, score, row in zip(keys, scores[indices].tolist(), rows)]
+
     def search(self, query: np.ndarray, top_k: int = 1, sim_method: str = None):
-        with self.__class__._lock:
+        """
+        クエリに近いベクトルを検索する。
+        query_cache_size が 1 以上の場合、同じクエリ・top_k・計算方式の結果はキャッシュから返します
+        （キャッシュはこのインスタンス経由の追加・更新・削除・クリアで破棄され、他のインスタンス・プロセスによる
+        更新も共有メモリ上の世代番号から検出して破棄します）。
+        キャッシュから返す結果のベクトルは毎回コピーするため、呼び出し側で変更してもキャッシュには影響しません。
+        戻り値: (キー, スコア, ベクトル, メタデータ) のリスト（スコアの降順）
+        """
+        with self.__class__._lock.read_lock():
             if query.shape != (self.dim,):
                 raise ValueError(f"Query vector must have shape ({self.dim},).")
             num_vectors = len(self)
             if num_vectors == 0:
                 return []
-            method = sim_method if sim_method is not None else self.sim_method
-            method_key = method.lower()
-            if method_key not in SIM_METHODS:
-                raise ValueError(f"Unsupported similarity method: {method}")
-            fun = SIM_METHODS[method_key]
-            data = self.vectors[:num_vectors]
-            scores = fun(data, query.astype(self.dtype))
-            sorted_indices = np.argsort(-scores)[:top_k]
-            results = []
-            for i in sorted_indices:
-                key = str(i + 1)
-                results.append((key, float(scores[i]), self.vectors[i].copy(), self.metadata.get(key)))
+            cache_key = None
+            if self._query_cache_size > 0:
+                method = sim_method if sim_method is not None else self.sim_method
+                cache_key = (query.astype(np.float32, copy=False).tobytes(), top_k, method.lower())
+                with self._query_cache_lock:
+                    generation = self.shared_generation()
+                    if generation != self._query_cache_generation:
+                        # 他のインスタンス・プロセスによる更新後は、キャッシュ済みの結果が古いため破棄
+                        self._query_cache.clear()
+                        self._query_cache_generation = generation
+                    cached = self._query_cache.get(cache_key)
+                    if cached is not None:
+                        self._query_cache.move_to_end(cache_key)
+                        return self._copy_results(cached)
+            scores = self._scores(query, sim_method, num_vectors)
+            results = self._top_k_results(scores, top_k)
+            if cache_key is not None:
+                with self._query_cache_lock:
+                    self._query_cache[cache_key] = results
+                    if len(self._query_cache) > self._query_cache_size:
+                        # 最も長く参照されていない結果を破棄
+                        self._query_cache.popitem(last=False)
+                results = self._copy_results(results)
+
+        return results
+
+    @staticmethod
+    def _copy_results(results: list) -> list:
+        """
+        キャッシュに保持する結果と呼び出し側へ返す結果が同じ配列を共有しないよう、ベクトルをコピーした結果リストを返します。
+        """
+        return [(key, score, vector.copy(), meta) for key, score, vector, meta in results]
+
+    def search_batch(self, queries: np.ndarray, top_k: int = 1, sim_method: str = None) -> list:
+        """
+        複数のクエリをまとめて検索する。
+        クエリごとに行列を走査する代わりに、全クエリのスコアを 1 回の行列積（GEMM）で計算します。
+          queries: 形状 (q, dim) の NumPy 配列
+        戻り値: クエリごとに search と同じ形式の結果リストを並べたリスト
+        """
+        with self.__class__._lock.read_lock():
+            if queries.ndim != 2 or queries.shape[1] != self.dim:
+                raise ValueError(f"Queries must have shape (n, {self.dim}).")
+            num_vectors = len(self)
+            if num_vectors == 0:
+                return [[] for _ in range(queries.shape[0])]
+            scores = self._scores(queries, sim_method, num_vectors)
+            results = [self._top_k_results(row, top_k) for row in scores]
 
         return results
 
     def update_vector(self, key: str, new_vector: np.ndarray, new_metadata: dict = None):
-        with self.__class__._lock:
+        with self._shared_write():
             idx = int(key) - 1
             num_vectors = len(self)
             if idx < 0 or idx >= num_vectors:
                 raise KeyError(f"Key {key} does not exist.")
             if new_vector.shape != (self.dim,):
                 raise ValueError(f"New vector must have shape ({self.dim},).")
-            self.vectors[idx] = new_vector.astype(self.dtype)
+            self._write_rows(idx, new_vector[np.newaxis, :])
             if new_metadata is not None:
                 self.metadata[key] = new_metadata
             self._update_shared_metadata()
 
 
     def filter_by_metadata(self, conditions=None) -> list:
-        with self.__class__._lock:
+        with self.__class__._lock.read_lock():
             if conditions is None:
                 return []
-            filtered = []
-            for key, meta in self.metadata.items():
-                if key == "params":
-                    continue
-                if callable(conditions):
-                    if conditions(meta):
-                        filtered.append(key)
-                elif isinstance(conditions, dict):
-                    if all(meta.get(k) == v for k, v in conditions.items()):
-                        filtered.append(key)
-                else:
-                    raise TypeError("conditions must be a dict or callable.")
+            if callable(conditions):
+                filtered = [key for key, meta in self.metadata.items()
+                            if key != "params" and conditions(meta)]
+            elif isinstance(conditions, dict):
+                rows = self._lookup_index(conditions)
+                if rows is None:
+                    # 転置インデックスを使えない場合は、各条件をメタデータの列（フィールドごとの配列）との
+                    # 一括比較によるマスクで評価
+                    mask = np.ones(len(self), dtype=bool)
+                    for k, v in conditions.items():
+                        mask &= self._match_column(k, v)
+                    rows = np.flatnonzero(mask)
+                filtered = [str(i + 1) for i in rows]
+            else:
+                raise TypeError("conditions must be a dict or callable.")
 
         return filtered
 
+    def _meta_column(self, field: str) -> np.ndarray:
+        """
+        メタデータの指定フィールドの値を行順に並べた配列（object 型）を返します。
+        列はフィールドごとにキャッシュし、メタデータの更新時に破棄されます。
+        """
+        column = self._meta_columns.get(field)
+        if column is None:
+            column = np.empty(len(self), dtype=object)
+            # メタデータは行順に並んでいるため、キー文字列を行ごとに生成して引き直さず順に走査する
+            rows = (meta for key, meta in self.metadata.items() if key != "params")
+            for i, meta in enumerate(rows):
+                column[i] = meta.get(field) if isinstance(meta, dict) else None
+            self._meta_columns[field] = column
+        return column
+
+    def _meta_index(self, field: str):
+        """
+        メタデータの指定フィールドについて、値 → 行番号（0-indexed、昇順）のリストの辞書を返します。
+        値にハッシュ不可能なもの（リスト・辞書など）が含まれる場合は None を返します。
+        列と同様にフィールドごとにキャッシュし、メタデータの更新時に破棄されます。
+        """
+        if field not in self._meta_indexes:
+            index = {}
+            try:
+                for i, item in enumerate(self._meta_column(field)):
+                    index.setdefault(item, []).append(i)
+            except TypeError:
+                index = None
+            self._meta_indexes[field] = index
+        return self._meta_indexes[field]
+
+    def _lookup_index(self, conditions: dict):
+        """
+        全条件を転置インデックスで評価し、一致する行番号（0-indexed、昇順）を返します。
+        いずれかの条件の値またはフィールドの値がハッシュ不可能で、インデックスを使えない場合は None を返します。
+        """
+        rows = None
+        for k, v in conditions.items():
+            try:
+                hash(v)
+            except TypeError:
+                return None
+            index = self._meta_index(k)
+            if index is None:
+                return None
+            matched = index.get(v, [])
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows if rows is not None else range(len(self))
+
+    def _match_column(self, field: str, value) -> np.ndarray:
+        """
+        メタデータの指定フィールドが value と一致する行を表すブール配列を返します。
+        """
+        column = self._meta_column(field)
+        if value is None or isinstance(value, (str, bytes, int, float, np.generic)):
+            # スカラー値は NumPy の要素ごとの比較で一括評価
+            return column == value
+        # リスト・辞書などは配列としてブロードキャストされないよう 1 件ずつ比較
+        return np.fromiter((item == value for item in column), dtype=bool, count=len(column))
+
     def delete(self, key: str):
-        with self.__class__._lock:
+        with self._shared_write():
             # 1) キー→インデックス変換＆存在チェック
             idx = int(key) - 1
             count = len(self)
             if idx < 0 or idx >= count:
                 raise KeyError(f"Key {key} does not exist.")
 
-            # 2) vectors を前に詰める（in-place シフト）
-            for i in range(idx, count - 1):
-                self.vectors[i] = self.vectors[i + 1]
-            # 空いた最後の行はゼロクリア
-            self.vectors[count - 1].fill(0)
+            # 2) vectors・ノルム・スケールを前に詰める（行ごとの Python ループではなくスライス 1 回の in-place シフト）
+            for rows in [self.vectors] + self._row_values():
+                rows[idx:count - 1] = rows[idx + 1:count]
+                # 空いた最後の行はゼロクリア
+                rows[count - 1] = 0
 
             # 3) metadata を再構築
             old_meta = self.metadata
             new_meta = {
-                "params": copy.deepcopy(old_meta["params"]),
+                "params": old_meta["params"],
             }
-            new_idx = 0
-            # 数値キーのみ再割り当て
-            for old_key, val in old_meta.items():
-                if old_key in ("params", "count"):
-                    continue
-                if int(old_key) == idx + 1:
-                    # 削除対象はスキップ
-                    continue
-                new_idx += 1
-                new_meta[str(new_idx)] = val
+            # メタデータは行順に並んでいるため、削除対象を除いて先頭から採番し直す
+            # （キー文字列を 1 件ずつ int に変換する必要はない）
+            rows = [val for old_key, val in old_meta.items() if old_key not in ("params", "count")]
+            del rows[idx]
+            new_meta.update(zip(map(str, range(1, len(rows) + 1)), rows))
 
             # 4) metadata を書き戻し
             self.metadata = new_meta
@@ -355,30 +726,30 @@ class VecTank:
         except ValueError:
             raise KeyError("キーはすべて 1-indexed の数値文字列である必要があります．")
 
-        with self.__class__._lock:
+        with self._shared_write():
             count = len(self)
             # 範囲チェック
             if any(idx < 0 or idx >= count for idx in del_idxs):
                 raise KeyError(f"存在しないキーがあります: {keys}")
 
-            # 2) 残すインデックスリストを作成
-            keep_idxs = [i for i in range(count) if i not in del_idxs]
-            new_count = len(keep_idxs)
+            # 2) 残す行を表すブールマスクを作成
+            keep = np.ones(count, dtype=bool)
+            keep[list(del_idxs)] = False
+            new_count = int(np.count_nonzero(keep))
 
-            # 3) vectors を in-place で前詰め
-            for new_i, old_i in enumerate(keep_idxs):
-                self.vectors[new_i] = self.vectors[old_i]
-            # 空いた後半部分はゼロクリア
-            for i in range(new_count, count):
-                self.vectors[i].fill(0)
+            # 3) vectors・ノルム・スケールをマスクで一括して前詰め（行ごとの Python ループを使わない）
+            for rows in [self.vectors] + self._row_values():
+                rows[:new_count] = rows[:count][keep]
+                # 空いた後半部分はゼロクリア
+                rows[new_count:count] = 0
 
-            # 4) metadata を再構築
+            # 4) metadata を再構築（行順に並んでいるため、残す行の値を先頭から採番し直す）
             old_meta = self.metadata
             new_meta = {
-                "params": copy.deepcopy(old_meta["params"]),
+                "params": old_meta["params"],
             }
-            for new_i, old_i in enumerate(keep_idxs):
-                new_meta[str(new_i + 1)] = old_meta[str(old_i + 1)]
+            rows = [val for old_key, val in old_meta.items() if old_key not in ("params", "count")]
+            new_meta.update(zip(map(str, range(1, new_count + 1)), itertools.compress(rows, keep)))
 
             # 5) 書き戻し
             self.metadata = new_meta
@@ -386,9 +757,11 @@ class VecTank:
         return keys
 
     def clear(self):
-        with self.__class__._lock:
+        with self._shared_write():
             self.vectors.fill(0)
-            params = copy.deepcopy(self.metadata.get("params", {}))
+            for row_values in self._row_values():
+                row_values.fill(0)
+            params = self.metadata.get("params", {})
             self.metadata.clear()
             self.metadata["params"] = params
             self._update_shared_metadata()
@@ -397,7 +770,7 @@ class VecTank:
         """
         ベクトルデータとメタデータをファイルに保存します。
         永続化モードが有効な場合にのみ動作し、store_dir 内に
-          ・ {tank_name}.npz  … 有効なベクトルデータ（_num_vectors 件分）
+          ・ {tank_name}.npy  … 有効なベクトルデータ（_num_vectors 件分）
           ・ {tank_name}.pkl  … メタデータ
         として保存します。
         """
@@ -417,8 +790,8 @@ class VecTank:
 
     def close(self):
         try:
-            self.shm.close()
-            self.meta_shm.close()
+            for block in self._shared_memories():
+                block.close()
         except Exception:
             pass
 
@@ -435,11 +808,11 @@ class VecTank:
             pass
 
     def __len__(self):
-        return len(self.metadata.keys()) - 1  # "params" を除外
+        return len(self.metadata) - 1  # "params" を除外
 
     def __str__(self):
         # return f"VecTank({json.dumps(self.metadata.get("params", {}), indent=2)},\nlen={len(self)})"
-        return f"VecTank({self.tank_name}, dim={self.dim}, max_capacity={self.max_capacity}, len={len(self)}, persist={self.persist}, sim_method={self.sim_method})"
+        return f"VecTank({self.tank_name}, dim={self.dim}, max_capacity={self.max_capacity}, len={len(self)}, persist={self.persist}, sim_method={self.sim_method}, dtype={self.dtype.name})"
 
 
 # ----------------------------------------------------------------------